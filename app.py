@@ -1,8 +1,24 @@
 # Standard library imports
 import datetime
+import functools
+import hashlib
+import heapq
+import hmac
+import io
+import json
+import os
+import random
+import re
+import sqlite3
 import time
 import logging
+import threading
 import traceback
+import unicodedata
+import urllib.parse
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Third-party imports
 import streamlit as st
@@ -10,8 +26,10 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import gspread
+import requests
 from pytz import timezone
 from google.oauth2.service_account import Credentials
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # Local/Try imports
 try:
@@ -30,6 +48,48 @@ ICE_TYPES = ['โม่', 'หลอดเล็ก', 'หลอดใหญ่'
 SHEET_ID = "1HVA9mDcDmyxfKvxQd4V5ZkWh4niq33PwVGY6gwoKnAE"
 TIMEZONE = "Asia/Bangkok"
 
+# สายส่งน้ำแข็ง (ชื่อชีทของแต่ละสาย)
+DELIVERY_CHAINS = [
+    "สายพ่วงข้าง",
+    "สายตลาดเช้า",
+    "สายรางม่วง2",
+    "สายหนองแร้ง",
+    "สายดงไผ่",
+    "สายร้านอาหาร",
+    "สายรอบเย็น"
+]
+
+# โควตา Google Sheets API (ต่อ service account) และการลองใหม่
+SHEETS_REQUESTS_PER_MINUTE = 60
+SHEETS_BURST = 10  # จำนวนคำขอที่ส่งติดกันได้ทันทีเมื่อว่าง
+SHEETS_MAX_RETRIES = 5
+SHEETS_MAX_BACKOFF = 32  # วินาที
+SHEETS_RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# ชีทที่เก็บ snapshot ไว้ในหน่วยความจำ (และในสำเนา SQLite เมื่อตั้งค่า LOCAL_MIRROR_PATH)
+# ชีทยอดขายไม่อยู่ในนี้ เพราะ SalesLedger ดึงเฉพาะแถวใหม่เอง
+SNAPSHOT_SHEETS = ["ตู้เย็น", "iceflow", "สรุปยอดค้าง", "ลูกค้าค้างเงิน", *DELIVERY_CHAINS]
+SNAPSHOT_REFRESH_INTERVAL = 60  # วินาที
+SNAPSHOT_WAIT_TIMEOUT = 30  # วินาทีที่รอเธรดเบื้องหลังดึงชีทที่ยังไม่มี
+
+# journal การขาย (write-behind)
+JOURNAL_DRAIN_INTERVAL = 5  # วินาที
+JOURNAL_BATCH_SIZE = 50
+JOURNAL_MAX_ATTEMPTS = 20
+JOURNAL_MAX_BACKOFF = 300  # วินาที
+JOURNAL_KEY_SHEET = "รายการที่ส่งแล้ว"  # รหัสรายการ journal ทุกรายการที่ส่งขึ้นแล้ว ใช้กันส่งซ้ำ
+JOURNAL_KEY_HEADERS = ["รหัสรายการ", "ประเภท", "เวลาที่ส่ง"]
+JOURNAL_KEY_RETENTION = 24 * 3600  # วินาที (นานกว่าช่วงที่รายการหนึ่งส่งใหม่ได้ JOURNAL_MAX_ATTEMPTS ครั้ง)
+JOURNAL_KEY_PRUNE_INTERVAL = 3600  # วินาที
+CHART_CACHE_SIZE = 32  # จำนวนภาพกราฟสูงสุดที่เก็บไว้ในแคช
+CHART_DPI = 120  # กว้างไม่เกินขนาดที่ Streamlit ย่อภาพ จะได้ส่งภาพจากแคชได้ทันที
+METRICS_RECENT_CALLS = 200  # จำนวนคำขอ Sheets API ล่าสุดที่แสดงในหน้าผู้ดูแลระบบ
+ADMIN_PAGE = "ผู้ดูแลระบบ"
+SALE_KEY_COLUMN = "รหัสรายการ"
+SHEET_CHUNK_ROWS = 50_000  # จำนวนแถวต่อคำขอเมื่อดึงชีทขนาดใหญ่ทีละช่วง
+SALES_LEDGER_MAX_AGE = 60  # วินาที ไม่ดึงแถวใหม่ซ้ำภายในช่วงนี้ (เท่ากับ ttl ของ loader ยอดขาย)
+ICE_COUNTER_COLS = ["รับเข้า", "ขายออก", "จำนวนละลาย", "ยอดขายรวม", "กำไรสุทธิ"]
+
 def set_custom_css():
     """ตั้งค่า CSS แบบกำหนดเองสำหรับแอปพลิเคชัน"""
     st.markdown("""
@@ -263,6 +323,344 @@ def reset_ice_session_state():
         logger.error(f"Error resetting ice session state: {e}")
         st.error(f"เกิดข้อผิดพลาดในการรีเซ็ตข้อมูลน้ำแข็ง: {str(e)}")
 
+def get_setting(name, default=None):
+    """อ่านค่าตั้งค่าจาก st.secrets หรือ environment variable"""
+    try:
+        if name in st.secrets:
+            return st.secrets[name]
+    except Exception:
+        pass
+    return os.environ.get(name, default)
+
+class AppMetrics:
+    """สถิติการทำงานระดับโปรเซส: คำขอ Sheets API, เวลาเรนเดอร์แต่ละหน้า และ cache hit/miss ของฟังก์ชันโหลดข้อมูล"""
+
+    def __init__(self, recent_calls=METRICS_RECENT_CALLS):
+        self._lock = threading.Lock()
+        self.reset(recent_calls)
+
+    def reset(self, recent_calls=METRICS_RECENT_CALLS):
+        with self._lock:
+            self.started_at = time.time()
+            self._api = {}  # (ชีท, คำสั่ง, ผลลัพธ์) -> สถิติ
+            self._pages = {}  # (หน้า, ผลลัพธ์) -> สถิติ
+            self._loaders = {}  # ชื่อฟังก์ชัน -> {"calls", "misses"}
+            self._recent = deque(maxlen=recent_calls)
+
+    def record_api(self, sheet, operation, seconds, rows, size, result):
+        """บันทึกคำขอ Sheets API หนึ่งครั้ง (rows = จำนวนแถวที่เขียน, size = ขนาดคำตอบเป็นไบต์)"""
+        with self._lock:
+            stats = self._api.setdefault(
+                (sheet, operation, result),
+                {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "rows": 0, "bytes": 0}
+            )
+            stats["count"] += 1
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            stats["rows"] += rows
+            stats["bytes"] += size
+            self._recent.append({
+                "time": time.time(), "sheet": sheet, "operation": operation,
+                "seconds": seconds, "rows": rows, "bytes": size, "result": result
+            })
+
+    def record_page(self, page, seconds, result):
+        """บันทึกเวลาเรนเดอร์หน้าหนึ่งครั้ง"""
+        with self._lock:
+            stats = self._pages.setdefault((page, result), {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+            stats["count"] += 1
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def record_loader(self, name, miss=False):
+        """นับการเรียกฟังก์ชันโหลดข้อมูล (miss=True เมื่อแคชไม่มีค่าและต้องโหลดใหม่)"""
+        with self._lock:
+            stats = self._loaders.setdefault(name, {"calls": 0, "misses": 0})
+            stats["misses" if miss else "calls"] += 1
+
+    def snapshot(self):
+        """สถิติทั้งหมดในรูปแบบที่แปลงเป็น JSON ได้"""
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "uptime_seconds": time.time() - self.started_at,
+                "sheets_api": [
+                    {"sheet": sheet, "operation": operation, "result": result, **stats}
+                    for (sheet, operation, result), stats in self._api.items()
+                ],
+                "pages": [
+                    {"page": page, "result": result, **stats}
+                    for (page, result), stats in self._pages.items()
+                ],
+                "loaders": [
+                    {"loader": name, "calls": stats["calls"], "misses": stats["misses"],
+                     "hits": max(0, stats["calls"] - stats["misses"])}
+                    for name, stats in self._loaders.items()
+                ],
+                "recent_calls": list(self._recent),
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self):
+        """สถิติในรูปแบบ Prometheus text exposition"""
+        data = self.snapshot()
+
+        def label(value):
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        def labels(**pairs):
+            return "{" + ",".join(f'{key}="{label(value)}"' for key, value in pairs.items()) + "}"
+
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{sample_labels} {value}" for sample_labels, value in samples)
+
+        api = [(labels(sheet=c["sheet"], operation=c["operation"], result=c["result"]), c) for c in data["sheets_api"]]
+        family("jaroenka_sheets_requests_total", "counter", "Google Sheets API HTTP requests",
+               [(l, c["count"]) for l, c in api])
+        family("jaroenka_sheets_request_seconds_sum", "counter", "Total Google Sheets API latency",
+               [(l, f'{c["seconds"]:.6f}') for l, c in api])
+        family("jaroenka_sheets_request_seconds_max", "gauge", "Slowest Google Sheets API request",
+               [(l, f'{c["max_seconds"]:.6f}') for l, c in api])
+        family("jaroenka_sheets_rows_written_total", "counter", "Rows sent to Google Sheets",
+               [(l, c["rows"]) for l, c in api])
+        family("jaroenka_sheets_response_bytes_total", "counter", "Bytes received from Google Sheets",
+               [(l, c["bytes"]) for l, c in api])
+
+        pages = [(labels(page=p["page"], result=p["result"]), p) for p in data["pages"]]
+        family("jaroenka_page_renders_total", "counter", "Page renders",
+               [(l, p["count"]) for l, p in pages])
+        family("jaroenka_page_render_seconds_sum", "counter", "Total page render time",
+               [(l, f'{p["seconds"]:.6f}') for l, p in pages])
+        family("jaroenka_page_render_seconds_max", "gauge", "Slowest page render",
+               [(l, f'{p["max_seconds"]:.6f}') for l, p in pages])
+
+        loaders = [(labels(loader=l["loader"]), l) for l in data["loaders"]]
+        family("jaroenka_loader_cache_hits_total", "counter", "Data loader calls served from st.cache_data",
+               [(l, s["hits"]) for l, s in loaders])
+        family("jaroenka_loader_cache_misses_total", "counter", "Data loader calls that reloaded data",
+               [(l, s["misses"]) for l, s in loaders])
+        family("jaroenka_uptime_seconds", "gauge", "Seconds since metrics were reset",
+               [("", f'{data["uptime_seconds"]:.0f}')])
+        return "\n".join(lines) + "\n"
+
+@st.cache_resource
+def get_app_metrics():
+    """สถิติการทำงานที่ใช้ร่วมกันทุก session"""
+    return AppMetrics()
+
+def instrumented_cache_data(ttl):
+    """เหมือน st.cache_data(ttl=...) แต่นับจำนวนครั้งที่เรียกและที่แคชไม่มีค่า (ยังเรียก .clear() ได้เหมือนเดิม)"""
+    def decorate(func):
+        name = func.__name__
+
+        @functools.wraps(func)
+        def load(*args, **kwargs):
+            # ส่วนนี้ทำงานเฉพาะตอน cache miss
+            get_app_metrics().record_loader(name, miss=True)
+            return func(*args, **kwargs)
+
+        cached = st.cache_data(ttl=ttl)(load)
+
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            get_app_metrics().record_loader(name)
+            return cached(*args, **kwargs)
+
+        call.clear = cached.clear
+        return call
+    return decorate
+
+def a1_sheet_title(a1_range):
+    """ชื่อชีทจาก A1 notation เช่น 'ยอดขาย'!A1:B2 -> ยอดขาย"""
+    title = a1_range.rsplit("!", 1)[0] if "!" in a1_range else a1_range
+    if len(title) >= 2 and title[0] == title[-1] == "'":
+        title = title[1:-1].replace("''", "'")
+    return title
+
+def find_sheet_ids(obj):
+    """sheetId ทั้งหมดที่อ้างถึงในคำขอ batchUpdate"""
+    if isinstance(obj, dict):
+        ids = {obj["sheetId"]} if "sheetId" in obj else set()
+        for value in obj.values():
+            ids |= find_sheet_ids(value)
+        return ids
+    if isinstance(obj, list):
+        return set().union(*(find_sheet_ids(value) for value in obj))
+    return set()
+
+def describe_sheets_request(method, endpoint, params=None, body=None):
+    """แยก (ชื่อชีท, คำสั่ง, จำนวนแถวที่เขียน) จาก URL และเนื้อหาของคำขอ Sheets API"""
+    path = urllib.parse.urlparse(endpoint).path
+    _, found, rest = path.partition("/spreadsheets/")
+    if not found:
+        return "", f"{method.upper()} {path}", 0
+    rest = rest[rest.find("/"):] if "/" in rest else rest[rest.find(":"):] if ":" in rest else ""
+    params = params if isinstance(params, dict) else {}
+    body = body if isinstance(body, dict) else {}
+
+    titles, rows = [], 0
+    if rest == "":
+        operation = "metadata"
+    elif rest == ":batchUpdate":
+        operation = "batchUpdate"
+        registry = get_sheet_registry()
+        titles = [registry.title_for_id(sheet_id) for sheet_id in find_sheet_ids(body.get("requests", []))]
+        for request in body.get("requests", []):
+            for kind in ("updateCells", "appendCells"):
+                rows += len(request.get(kind, {}).get("rows", []))
+    elif rest.startswith("/values:"):
+        operation = "values." + rest[len("/values:"):]
+        ranges = params.get("ranges", [])
+        titles = [a1_sheet_title(r) for r in ([ranges] if isinstance(ranges, str) else ranges)]
+        for item in body.get("data", []):
+            titles.append(a1_sheet_title(item.get("range", "")))
+            rows += len(item.get("values", []))
+        titles += [a1_sheet_title(r) for r in body.get("ranges", [])]
+    elif rest.startswith("/values/"):
+        # ช่วงเซลล์ใน URL ถูก percent-encode แล้ว ":" ที่เหลือจึงเป็นตัวคั่นคำสั่ง เช่น :append
+        a1_range, _, action = rest[len("/values/"):].partition(":")
+        operation = "values." + (action or ("get" if method.upper() == "GET" else "update"))
+        titles = [a1_sheet_title(urllib.parse.unquote(a1_range))]
+        rows = len(body.get("values", []))
+    else:
+        operation = f"{method.upper()} {rest}"
+    return ",".join(sorted({title for title in titles if title})), operation, rows
+
+class TokenBucket:
+    """ตัวจำกัดอัตราคำขอแบบ token bucket ที่ลดอัตราลงเมื่อโดน 429 และค่อยๆ เพิ่มกลับเมื่อสำเร็จ"""
+
+    def __init__(self, per_minute, capacity):
+        self.max_rate = per_minute / 60.0
+        self.rate = self.max_rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """รอจนมี token ว่างแล้วหยิบไปหนึ่งอัน"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def throttle(self):
+        """โดนจำกัดอัตรา ลดอัตราลงครึ่งหนึ่ง (ไม่ต่ำกว่า 1/8 ของโควตา)"""
+        with self._lock:
+            self.rate = max(self.max_rate / 8, self.rate / 2)
+
+    def recover(self):
+        """คำขอสำเร็จ เพิ่มอัตรากลับทีละน้อยจนเต็มโควตา"""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+class SheetsGateway(gspread.http_client.HTTPClient):
+    """HTTP client ของ gspread ที่ทุกคำขอต้องผ่าน: จำกัดอัตรา ลองใหม่เมื่อพลาดชั่วคราว และรวมคำขออ่านที่ซ้ำกัน"""
+
+    def __init__(self, auth, session=None):
+        super().__init__(auth, session)
+        self.limiter = TokenBucket(
+            int(get_setting("SHEETS_REQUESTS_PER_MINUTE", SHEETS_REQUESTS_PER_MINUTE)),
+            SHEETS_BURST
+        )
+        self._flights = {}  # คำขออ่านที่กำลังส่ง -> ผลลัพธ์ที่ผู้รอใช้ร่วมกัน
+        self._flights_lock = threading.Lock()
+
+    def request(self, method, endpoint, params=None, data=None, json=None, files=None, headers=None):
+        kwargs = dict(params=params, data=data, json=json, files=files, headers=headers)
+        call = describe_sheets_request(method, endpoint, params, json)
+        if method.upper() != "GET":
+            return self._send(method, endpoint, kwargs, call)
+
+        # คำขออ่านที่เหมือนกันและกำลังส่งอยู่ รอผลของคำขอนั้นแทนการส่งซ้ำ
+        key = (endpoint, repr(sorted(params.items()) if isinstance(params, dict) else params))
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = {"done": threading.Event(), "response": None, "error": None}
+        if not leader:
+            started = time.perf_counter()
+            flight["done"].wait()
+            get_app_metrics().record_api(*call[:2], time.perf_counter() - started, 0, 0, "coalesced")
+            if flight["error"] is not None:
+                raise flight["error"]
+            return flight["response"]
+
+        try:
+            flight["response"] = self._send(method, endpoint, kwargs, call)
+            return flight["response"]
+        except Exception as e:
+            flight["error"] = e
+            raise
+        finally:
+            with self._flights_lock:
+                self._flights.pop(key, None)
+            flight["done"].set()
+
+    def _send(self, method, endpoint, kwargs, call):
+        # คำขอเขียนลองใหม่เฉพาะ 429 ซึ่งรับประกันว่ายังไม่ถูกบันทึก
+        is_read = method.upper() == "GET"
+        sheet, operation, rows = call
+        metrics = get_app_metrics()
+        for attempt in range(SHEETS_MAX_RETRIES + 1):
+            self.limiter.acquire()
+            started = time.perf_counter()
+            try:
+                response = super().request(method, endpoint, **kwargs)
+                metrics.record_api(sheet, operation, time.perf_counter() - started, rows, len(response.content), "ok")
+                self.limiter.recover()
+                return response
+            except gspread.exceptions.APIError as e:
+                metrics.record_api(sheet, operation, time.perf_counter() - started, rows, 0, str(e.code))
+                if e.code == 400:
+                    forget_missing_sheet(e)
+                if e.code == 429:
+                    self.limiter.throttle()
+                retryable = e.code in SHEETS_RETRY_STATUSES if is_read else e.code == 429
+                if not retryable or attempt == SHEETS_MAX_RETRIES:
+                    raise
+                error = e
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                metrics.record_api(sheet, operation, time.perf_counter() - started, rows, 0, type(e).__name__)
+                if not is_read or attempt == SHEETS_MAX_RETRIES:
+                    raise
+                error = e
+            # full jitter กันหลายเธรดลองใหม่พร้อมกัน
+            wait = random.uniform(0, min(SHEETS_MAX_BACKOFF, 2 ** attempt))
+            logger.warning(f"Sheets API {method} retry {attempt + 1}/{SHEETS_MAX_RETRIES} in {wait:.1f}s: {error}")
+            time.sleep(wait)
+
+def forget_missing_sheet(error):
+    """ล้าง Worksheet ในแคชเมื่อคำขอล้มเหลวเพราะชีทถูกลบหรือสร้างใหม่ (sheetId หรือชื่อชีทในแคชใช้ไม่ได้แล้ว)"""
+    message = str(error)
+    registry = get_sheet_registry()
+    grid = re.search(r"No grid with id: (\d+)", message)
+    if grid:
+        sheet_id = int(grid.group(1))
+        title = registry.title_for_id(sheet_id)
+        # sheetId ที่ไม่อยู่ในแคชแล้ว ล้างทั้งหมดเพื่อโหลดรายชื่อชีทใหม่
+        registry.invalidate(None if title == str(sheet_id) else title)
+    elif "Unable to parse range:" in message:
+        title = a1_sheet_title(message.split("Unable to parse range:", 1)[1].strip())
+        registry.invalidate(title)
+    else:
+        return
+    logger.warning(f"Sheet {title} no longer matches the cached handle, reloading sheet list")
+
 @st.cache_resource
 def connect_google_sheets(max_retries=3):
     """เชื่อมต่อกับ Google Sheets API"""
@@ -281,7 +679,7 @@ def connect_google_sheets(max_retries=3):
                 st.secrets["GCP_SERVICE_ACCOUNT"],
                 scopes=scope
             )
-            gc = gspread.authorize(credentials)
+            gc = gspread.authorize(credentials, http_client=SheetsGateway)
             logger.info("Connected to Google Sheets successfully")
             return gc
         except Exception as e:
@@ -289,34 +687,574 @@ def connect_google_sheets(max_retries=3):
                 handle_error(e, "การเชื่อมต่อ Google Sheets")
                 return None
             time.sleep(2 ** attempt)  # Exponential backoff
-        
-@st.cache_data(ttl=60)
-def load_customer_summary():
-    """โหลดข้อมูลสรุปยอดค้าง"""
-    try:
-        gc = connect_google_sheets()
-        if not gc:
-            return pd.DataFrame()
-            
-        sheet = gc.open_by_key(SHEET_ID)
+
+class SheetRegistry:
+    """แคชอ็อบเจ็กต์ Spreadsheet/Worksheet ระดับโปรเซส (คีย์ตามชื่อชีท)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spreadsheet = None
+        self._worksheets = {}
+
+    def spreadsheet(self):
+        """คืนค่า Spreadsheet ที่เปิดไว้แล้ว หรือ None หากเชื่อมต่อไม่ได้"""
+        with self._lock:
+            if self._spreadsheet is None:
+                gc = connect_google_sheets()
+                if not gc:
+                    return None
+                self._spreadsheet = gc.open_by_key(SHEET_ID)
+            return self._spreadsheet
+
+    def worksheet(self, title):
+        """คืนค่า Worksheet ตามชื่อ (ดึงรายชื่อชีททั้งหมดในคำขอเดียวเมื่อไม่พบในแคช)"""
+        with self._lock:
+            worksheet = self._worksheets.get(title)
+        if worksheet is not None:
+            return worksheet
+
+        spreadsheet = self.spreadsheet()
+        if spreadsheet is None:
+            return None
+
+        worksheets = {ws.title: ws for ws in spreadsheet.worksheets()}
+        with self._lock:
+            self._worksheets = worksheets
+        if title not in worksheets:
+            raise gspread.WorksheetNotFound(title)
+        return worksheets[title]
+
+    def titles(self, refresh=False):
+        """รายชื่อชีททั้งหมดใน Spreadsheet (refresh=True โหลดรายชื่อใหม่จาก Google Sheets)"""
+        with self._lock:
+            if self._worksheets and not refresh:
+                return set(self._worksheets)
+        spreadsheet = self.spreadsheet()
+        if spreadsheet is None:
+            return set()
+        worksheets = {ws.title: ws for ws in spreadsheet.worksheets()}
+        with self._lock:
+            self._worksheets = worksheets
+        return set(worksheets)
+
+    def add_worksheet(self, title, rows, cols):
+        """สร้างชีทใหม่และลงทะเบียนในแคช"""
+        spreadsheet = self.spreadsheet()
+        if spreadsheet is None:
+            return None
+        worksheet = spreadsheet.add_worksheet(title=title, rows=rows, cols=cols)
+        with self._lock:
+            self._worksheets[title] = worksheet
+        logger.info(f"Created worksheet {title}")
+        return worksheet
+
+    def title_for_id(self, sheet_id):
+        """ชื่อชีทจาก sheetId (คืนค่า id เป็นข้อความหากยังไม่รู้จักชีทนี้)"""
+        with self._lock:
+            for title, worksheet in self._worksheets.items():
+                if worksheet.id == sheet_id:
+                    return title
+        return str(sheet_id)
+
+    def invalidate(self, title=None):
+        """ล้างแคช Worksheet ทั้งหมด หรือเฉพาะชื่อที่ระบุ"""
+        with self._lock:
+            if title is None:
+                self._worksheets = {}
+            else:
+                self._worksheets.pop(title, None)
+
+@st.cache_resource
+def get_sheet_registry():
+    """ทะเบียน Spreadsheet/Worksheet ที่ใช้ร่วมกันทุก session"""
+    return SheetRegistry()
+
+def get_spreadsheet():
+    """คืนค่า Spreadsheet หลักจากแคช"""
+    return get_sheet_registry().spreadsheet()
+
+def get_worksheet(title):
+    """คืนค่า Worksheet จากแคช (ส่ง gspread.WorksheetNotFound หากไม่มีชีทนี้)"""
+    return get_sheet_registry().worksheet(title)
+
+def add_worksheet(title, rows=100, cols=10):
+    """สร้าง Worksheet ใหม่และอัปเดตแคช"""
+    return get_sheet_registry().add_worksheet(title, rows, cols)
+
+def to_cell_data(value):
+    """แปลงค่า Python เป็น CellData สำหรับคำขอ batchUpdate"""
+    if isinstance(value, (bool, np.bool_)):
+        return {"userEnteredValue": {"boolValue": bool(value)}}
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        if pd.isna(value):
+            return {"userEnteredValue": {"stringValue": ""}}
+        return {"userEnteredValue": {"numberValue": float(value)}}
+    return {"userEnteredValue": {"stringValue": "" if value is None else str(value)}}
+
+def update_cells_request(worksheet, row, col, values):
+    """สร้างคำขอ updateCells สำหรับค่าหลายเซลล์ติดกันในแถวเดียว (row/col เริ่มที่ 1)"""
+    return {
+        "updateCells": {
+            "start": {"sheetId": worksheet.id, "rowIndex": row - 1, "columnIndex": col - 1},
+            "rows": [{"values": [to_cell_data(v) for v in values]}],
+            "fields": "userEnteredValue"
+        }
+    }
+
+def append_cells_request(worksheet, rows):
+    """สร้างคำขอ appendCells สำหรับเพิ่มหลายแถวต่อท้ายชีท"""
+    return {
+        "appendCells": {
+            "sheetId": worksheet.id,
+            "rows": [{"values": [to_cell_data(v) for v in row]} for row in rows],
+            "fields": "userEnteredValue"
+        }
+    }
+
+def commit_sheet_requests(requests):
+    """ส่งคำขอแก้ไขหลายชีทใน batchUpdate ครั้งเดียว (สำเร็จหรือล้มเหลวทั้งชุด)"""
+    if not requests:
+        return None
+    spreadsheet = get_spreadsheet()
+    if spreadsheet is None:
+        raise ConnectionError("ไม่สามารถเชื่อมต่อ Google Sheet ได้")
+    return spreadsheet.batch_update({"requests": requests})
+
+def pad_values(values):
+    """เติมเซลล์ว่างให้ทุกแถวยาวเท่ากันแบบเดียวกับ get_all_values"""
+    return gspread.utils.fill_gaps(values) if values else []
+
+def values_to_records(values):
+    """แปลงค่าดิบของชีทเป็น list ของ dict แบบเดียวกับ get_all_records"""
+    if not values:
+        return []
+    headers = values[0]
+    width = len(headers)
+    return [
+        dict(zip(headers, gspread.utils.numericise_all((list(row) + [""] * width)[:width])))
+        for row in values[1:]
+    ]
+
+def iter_sheet_rows(worksheet, start_row=1, chunk_rows=SHEET_CHUNK_ROWS):
+    """ดึงแถวของชีททีละช่วง A1 ขนาดคงที่ yield (เลขแถวแรก, แถวดิบ) และดึงช่วงถัดไปล่วงหน้าระหว่างที่ผู้เรียกประมวลผลช่วงปัจจุบัน"""
+    def fetch(row):
+        return [list(r) for r in worksheet.get(f"{row}:{row + chunk_rows - 1}")]
+
+    # Sheets ตัดแถวว่างท้ายช่วงออก ช่วงที่ได้แถวไม่ครบจึงไม่ได้แปลว่าหมดชีท
+    # ดึงต่อจนเลยจำนวนแถวของชีท (ดึงต่อเสมอหากช่วงเต็ม เผื่อชีทยาวขึ้นหลังอ่านจำนวนแถว)
+    row_count = worksheet.row_count
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        row, rows = start_row, fetch(start_row)
+        while True:
+            next_row = row + chunk_rows
+            more = len(rows) == chunk_rows or next_row <= row_count
+            upcoming = pool.submit(fetch, next_row) if more else None
+            if len(rows) < chunk_rows and upcoming is not None and upcoming.result():
+                # แถวว่างท้ายช่วงที่ยังมีข้อมูลต่อ เติมให้ครบเพื่อให้เลขแถวต่อเนื่อง
+                rows = rows + [[] for _ in range(chunk_rows - len(rows))]
+            if rows:
+                yield row, rows
+            if upcoming is None:
+                return
+            row, rows = next_row, upcoming.result()
+
+class SheetMirror:
+    """สำเนาข้อมูลชีทใน SQLite (WAL) ใช้เป็นแหล่งอ่านข้อมูลแบบ local"""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sheet_rows (
+                sheet TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (sheet, row)
+            );
+            CREATE TABLE IF NOT EXISTS sheet_meta (
+                sheet TEXT PRIMARY KEY,
+                row_count INTEGER NOT NULL,
+                stale INTEGER NOT NULL DEFAULT 0,
+                synced_at REAL NOT NULL
+            );
+        """)
+
+    def _meta(self, sheet):
+        return self._conn.execute(
+            "SELECT row_count, stale FROM sheet_meta WHERE sheet = ?", (sheet,)
+        ).fetchone()
+
+    def has(self, sheet, fresh=True):
+        """ตรวจว่ามีสำเนาของชีทนี้ (และยังไม่ถูกทำเครื่องหมายว่าเก่า)"""
+        with self._lock:
+            meta = self._meta(sheet)
+        return meta is not None and not (fresh and meta[1])
+
+    def row_count(self, sheet):
+        """จำนวนแถวของชีทที่มีในสำเนา (รวม header)"""
+        with self._lock:
+            meta = self._meta(sheet)
+        return meta[0] if meta else 0
+
+    def values(self, sheet, start_row=1):
+        """อ่านค่าทุกแถวตั้งแต่ start_row หรือ None หากยังไม่เคยซิงค์ชีทนี้"""
+        with self._lock:
+            if self._meta(sheet) is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT data FROM sheet_rows WHERE sheet = ? AND row >= ? ORDER BY row",
+                (sheet, start_row)
+            ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def iter_rows(self, sheet, start_row=1, chunk_rows=SHEET_CHUNK_ROWS):
+        """อ่านแถวทีละช่วง yield (เลขแถวแรก, แถวดิบ) โดยไม่โหลดสำเนาทั้งชีทเข้าหน่วยความจำพร้อมกัน"""
+        row = start_row
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT row, data FROM sheet_rows WHERE sheet = ? AND row >= ? ORDER BY row LIMIT ?",
+                    (sheet, row, chunk_rows)
+                ).fetchall()
+            if not rows:
+                return
+            yield rows[0][0], [json.loads(data) for _, data in rows]
+            if len(rows) < chunk_rows:
+                return
+            row = rows[-1][0] + 1
+
+    def store(self, sheet, values):
+        """แทนที่สำเนาของชีททั้งชีท"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sheet_rows WHERE sheet = ?", (sheet,))
+            self._insert_rows(sheet, 1, values)
+            self._set_meta(sheet, len(values))
+
+    def store_rows(self, sheet, start_row, rows):
+        """เขียนทับ/เพิ่มแถวตั้งแต่ start_row (ใช้กับชีทที่เพิ่มข้อมูลต่อท้ายอย่างเดียว)"""
+        with self._lock, self._conn:
+            self._insert_rows(sheet, start_row, rows)
+            meta = self._meta(sheet)
+            self._set_meta(sheet, max(meta[0] if meta else 0, start_row + len(rows) - 1))
+
+    def mark_synced(self, *sheets):
+        """บันทึกว่าสำเนาตรงกับชีทแล้วโดยไม่เขียนแถวใหม่ (ใช้เมื่อค่าที่ดึงมาไม่เปลี่ยน)"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE sheet_meta SET stale = 0, synced_at = ? WHERE sheet = ?",
+                [(time.time(), sheet) for sheet in sheets]
+            )
+
+    def mark_stale(self, sheet):
+        """ทำเครื่องหมายว่าสำเนาเก่า ให้อ่านครั้งถัดไปดึงจาก Google Sheets"""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE sheet_meta SET stale = 1 WHERE sheet = ?", (sheet,))
+
+    def _insert_rows(self, sheet, start_row, rows):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO sheet_rows (sheet, row, data) VALUES (?, ?, ?)",
+            [(sheet, start_row + i, json.dumps(row, ensure_ascii=False)) for i, row in enumerate(rows)]
+        )
+
+    def _set_meta(self, sheet, row_count):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sheet_meta (sheet, row_count, stale, synced_at) VALUES (?, ?, 0, ?)",
+            (sheet, row_count, time.time())
+        )
+
+class SheetSnapshots:
+    """ค่าล่าสุดของแต่ละชีทในหน่วยความจำ ใช้ร่วมกันทุก session (ดึงจาก Google Sheets โดย SnapshotRefresher เท่านั้น)"""
+
+    def __init__(self, titles, interval):
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._values = {}            # ชื่อชีท -> ค่าดิบทั้งชีท
+        self._fetched_at = {}        # ชื่อชีท -> เวลาที่ดึงล่าสุด (time.monotonic)
+        self._stale = set()          # ชีทที่ถูกแก้ไขหลังดึงครั้งล่าสุด
+        self._wanted = set(titles)   # ชีทที่ต้องดึงในรอบถัดไป
+        self._inflight = set()       # ชีทในรอบที่กำลังดึง (ที่ยังไม่ถูกแก้ไขหลังเริ่มรอบ)
+        self._errors = {}            # ข้อผิดพลาดของรอบล่าสุด (ชื่อชีท -> exception)
+        self._started = 0            # ลำดับรอบที่เริ่มดึงล่าสุด
+        self._completed = 0          # ลำดับรอบที่ดึงเสร็จล่าสุด
+
+    def get(self, title, fresh=True):
+        """ค่าของชีทจาก snapshot หรือ None หากยังไม่มี (หรือเก่าเกินไปเมื่อ fresh=True)"""
+        with self._cond:
+            if title not in self._values:
+                return None
+            if fresh and (title in self._stale or time.monotonic() - self._fetched_at[title] > 2 * self.interval):
+                return None
+            return self._values[title]
+
+    def seed(self, title, values):
+        """ใส่ค่าเริ่มต้นจากสำเนา local แล้วให้รอบถัดไปดึงค่าจริงมาแทน"""
+        with self._cond:
+            self._values[title] = values
+            self._fetched_at[title] = time.monotonic()
+            self._wanted.add(title)
+            self._cond.notify_all()
+
+    def fetch(self, title, timeout=SNAPSHOT_WAIT_TIMEOUT):
+        """ขอให้เธรดเบื้องหลังดึงชีทนี้ แล้วรอผลของรอบนั้น (คำขอชีทเดียวกันจากหลาย session รวมเป็นรอบเดียว)"""
+        with self._cond:
+            if title in self._inflight:
+                # รอบที่กำลังดึงมีชีทนี้อยู่แล้ว รอผลรอบนั้นได้เลย
+                target = self._started
+            else:
+                self._wanted.add(title)
+                target = self._started + 1
+                self._cond.notify_all()
+            if not self._cond.wait_for(lambda: self._completed >= target, timeout=timeout):
+                raise TimeoutError(f"Timed out waiting for snapshot of {title}")
+            if title in self._errors:
+                raise self._errors[title]
+            if title not in self._values:
+                raise ConnectionError(f"ไม่สามารถดึงข้อมูลชีท {title} ได้")
+            return self._values[title]
+
+    def mark_stale(self, *titles):
+        """ทำเครื่องหมายว่าชีทถูกแก้ไข และปลุกเธรดเบื้องหลังให้ดึงใหม่ทันที"""
+        with self._cond:
+            titles = [t for t in titles if t in self._values]
+            self._inflight.difference_update(titles)
+            self._stale.update(titles)
+            self._wanted.update(titles)
+            if titles:
+                self._cond.notify_all()
+
+    def next_round(self):
+        """รอจนถึงรอบดึงถัดไป (ครบรอบเวลาหรือมีคำขอ) แล้วคืนค่าลำดับรอบและชื่อชีทที่ต้องดึง"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._wanted, timeout=self.interval)
+            titles = set(self._values) | self._wanted
+            self._wanted = set()
+            self._inflight = set(titles)
+            self._started += 1
+            return self._started, titles
+
+    def finish_round(self, round_id, results, errors):
+        """เก็บผลของรอบดึง แล้วคืนค่ารายชื่อชีทที่ค่าเปลี่ยน"""
+        changed = []
+        now = time.monotonic()
+        with self._cond:
+            for title, values in results.items():
+                if self._values.get(title) != values:
+                    changed.append(title)
+                self._values[title] = values
+                self._fetched_at[title] = now
+                self._stale.discard(title)
+            for title, error in errors.items():
+                if isinstance(error, gspread.WorksheetNotFound):
+                    # เลิกติดตามชีทที่ไม่มีอยู่ จนกว่าจะมีการขอใหม่
+                    self._values.pop(title, None)
+                    self._fetched_at.pop(title, None)
+                    self._stale.discard(title)
+            self._errors = errors
+            self._inflight = set()
+            self._completed = round_id
+            self._cond.notify_all()
+        return changed
+
+class SnapshotRefresher(threading.Thread):
+    """เธรดเบื้องหลังเธรดเดียวที่ดึงทุกชีทใน snapshot ด้วย values_batch_get ครั้งเดียวต่อรอบ"""
+
+    def __init__(self, snapshots):
+        super().__init__(name="snapshot-refresh", daemon=True)
+        self.snapshots = snapshots
+        self.unsynced = set()  # ชีทที่ค่าเปลี่ยนแต่ยังเขียนลงสำเนา local ไม่สำเร็จ
+
+    def run(self):
+        while True:
+            # ข้อผิดพลาดใดๆ ในรอบ (เช่น SQLite ล็อกหรือดิสก์เต็ม) ต้องไม่ทำให้เธรดนี้หยุด
+            # มิฉะนั้นทุกการอ่านจะรอจนหมดเวลาแล้วได้ค่าเก่าไปจนกว่าจะรีสตาร์ท
+            try:
+                self.run_round()
+            except Exception as e:
+                logger.error(f"Snapshot refresh round failed: {e}")
+
+    def run_round(self):
+        """ดึงชีทหนึ่งรอบ เก็บผล แล้วอัปเดตสำเนา local และแคชของชีทที่ค่าเปลี่ยน"""
+        round_id, titles = self.snapshots.next_round()
         try:
-            worksheet = sheet.worksheet("สรุปยอดค้าง")
-            df = pd.DataFrame(worksheet.get_all_records())
-            
-            # แปลงคอลัมน์ตัวเลข
-            numeric_cols = ["ยอดค้างสะสม", "ยอดชำระสะสม", "ยอดค้างคงเหลือ"]
-            for col in numeric_cols:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
-            
-            return df
-        except gspread.WorksheetNotFound:
-            return pd.DataFrame()
+            results, errors = self.fetch(titles)
+        except Exception as e:
+            logger.warning(f"Snapshot refresh failed: {e}")
+            results, errors = {}, {title: e for title in titles}
+        changed = self.snapshots.finish_round(round_id, results, errors)
+
+        mirror = get_sheet_mirror()
+        if mirror is not None:
+            # เขียนใหม่เฉพาะชีทที่ค่าเปลี่ยน (รวมรอบก่อนที่เขียนไม่สำเร็จ) หรือยังไม่มีในสำเนา
+            # ชีทอื่นแค่บันทึกว่าซิงค์แล้ว
+            self.unsynced.update(changed)
+            unchanged = []
+            for title, values in results.items():
+                if title in self.unsynced or not mirror.has(title, fresh=False):
+                    mirror.store(title, values)
+                    self.unsynced.discard(title)
+                else:
+                    unchanged.append(title)
+            mirror.mark_synced(*unchanged)
+        if changed:
+            clear_sheet_caches(*changed)
+
+    def fetch(self, titles):
+        """ดึงค่าของทุกชีทที่มีอยู่จริงในคำขอเดียว"""
+        spreadsheet = get_spreadsheet()
+        if spreadsheet is None:
+            raise ConnectionError("ไม่สามารถเชื่อมต่อ Google Sheet ได้")
+        registry = get_sheet_registry()
+        known = registry.titles()
+        if titles - known:
+            # ชีทอาจถูกสร้างหลังโหลดรายชื่อ โหลดรายชื่อใหม่ครั้งเดียวต่อรอบ
+            known = registry.titles(refresh=True)
+        errors = {title: gspread.WorksheetNotFound(title) for title in titles - known}
+        titles = [t for t in titles if t not in errors]
+        if not titles:
+            return {}, errors
+
+        result = spreadsheet.values_batch_get([gspread.utils.absolute_range_name(t) for t in titles])
+        results = {
+            title: pad_values(value_range.get("values", []))
+            for title, value_range in zip(titles, result.get("valueRanges", []))
+        }
+        return results, errors
+
+@st.cache_resource
+def get_sheet_snapshots():
+    """snapshot ของชีทที่ใช้ร่วมกันทุก session พร้อมเธรดรีเฟรชเบื้องหลัง"""
+    snapshots = SheetSnapshots(SNAPSHOT_SHEETS, SNAPSHOT_REFRESH_INTERVAL)
+    SnapshotRefresher(snapshots).start()
+    return snapshots
+
+@st.cache_resource
+def get_sheet_mirror():
+    """สำเนา SQLite ที่ใช้ร่วมกันทุก session (None หากไม่ได้ตั้งค่า LOCAL_MIRROR_PATH)"""
+    path = get_setting("LOCAL_MIRROR_PATH")
+    if not path:
+        return None
+    mirror = SheetMirror(path)
+    logger.info(f"Local sheet mirror enabled at {path}")
+    return mirror
+
+def read_sheet_values(title):
+    """อ่านค่าดิบทั้งชีทจาก snapshot ที่ใช้ร่วมกัน (เธรดเบื้องหลังดึงจาก Google Sheets เมื่อยังไม่มีหรือเก่า)"""
+    snapshots = get_sheet_snapshots()
+    values = snapshots.get(title)
+    if values is not None:
+        return values
+
+    # เริ่มจากสำเนา local ได้ทันที แล้วให้รอบถัดไปดึงค่าจริง
+    mirror = get_sheet_mirror()
+    if mirror is not None and mirror.has(title):
+        values = mirror.values(title)
+        snapshots.seed(title, values)
+        return values
+
+    try:
+        return snapshots.fetch(title)
+    except gspread.WorksheetNotFound:
+        raise
     except Exception as e:
-        handle_error(e, "การโหลดข้อมูลสรุปยอดค้าง")
-        return pd.DataFrame()
+        # ใช้ค่าเดิมระหว่างที่เครือข่ายมีปัญหา
+        values = snapshots.get(title, fresh=False)
+        if values is None and mirror is not None and mirror.has(title, fresh=False):
+            values = mirror.values(title)
+        if values is not None:
+            logger.warning(f"Reading stale snapshot of {title}: {e}")
+            return values
+        raise
+        
+# ชนิดข้อมูลของคอลัมน์ในแต่ละชีท แปลงครั้งเดียวตอนโหลดเพื่อให้ DataFrame ในแคชเล็กลงและกรอง/จัดกลุ่มบน array ที่มีชนิด
+# "text" ตัดช่องว่าง, "category" ข้อความที่มีค่าซ้ำมาก, "int32" ตัวนับ (ตัดทศนิยมแบบ safe_int),
+# "float64" จำนวนเงิน (คงความละเอียดเดิมเพราะค่าถูกเขียนกลับชีท),
+# ("datetime", รูปแบบ, dayfirst) วันเวลา โดย dayfirst ใช้กับค่าที่ไม่ตรงรูปแบบ ตามที่แต่ละหน้าเคยแปลงคอลัมน์นั้น
+SHEET_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+SHEET_DATE_FORMAT = "%d/%m/%Y"
+
+PRODUCT_SCHEMA = {
+    "ชื่อสินค้า": "text",
+    "ราคาขาย": "float64",
+    "ต้นทุน": "float64",
+    "เข้า": "int32",
+    "ออก": "int32",
+    "คงเหลือในตู้": "int32",
+}
+SALES_SCHEMA = {
+    "วันที่": ("datetime", SHEET_TIMESTAMP_FORMAT, False),
+    "ยอดขาย": "float64",
+    "กำไร": "float64",
+    "ประเภท": "category",
+}
+CUSTOMER_SUMMARY_SCHEMA = {
+    "ชื่อลูกค้า": "text",
+    "สายส่ง": "category",
+    "ยอดค้างสะสม": "float64",
+    "ยอดชำระสะสม": "float64",
+    "ยอดค้างคงเหลือ": "float64",
+    "อัปเดตล่าสุด": ("datetime", SHEET_TIMESTAMP_FORMAT, False),
+}
+CUSTOMER_DEBT_SCHEMA = {
+    "วันที่": ("datetime", SHEET_DATE_FORMAT, True),
+    "ชื่อลูกค้า": "text",
+    "สายส่ง": "category",
+    "ยอดค้าง": "float64",
+    "ชำระแล้ว": "float64",
+    "คงค้าง": "float64",
+}
+DELIVERY_SCHEMA = {
+    "วันที่": ("datetime", SHEET_DATE_FORMAT, True),
+    **{
+        f"น้ำแข็ง{ice_type}_{field}": "int32"
+        for ice_type in ICE_TYPES
+        for field in ("ใช้", "เหลือ", "ค้าง", "ละลาย")
+    },
+    "ยอดขายสุทธิ": "float64",
+}
+
+def parse_sheet_dates(values, date_format, dayfirst=False):
+    """แปลงคอลัมน์วันที่ของชีทด้วยรูปแบบที่ระบุ (ค่าที่ไม่ตรงรูปแบบ เช่นแถวเก่า ใช้การเดารูปแบบของ pandas)"""
+    parsed = pd.to_datetime(values, format=date_format, errors="coerce")
+    leftover = parsed.isna() & values.notna() & (values.astype(str).str.strip() != "")
+    if leftover.any():
+        parsed[leftover] = pd.to_datetime(values[leftover], format="mixed", dayfirst=dayfirst, errors="coerce")
+    return parsed
+
+def apply_sheet_schema(df, schema):
+    """แปลงคอลัมน์ของ DataFrame ตามชนิดข้อมูลที่ประกาศไว้ (ข้ามคอลัมน์ที่ไม่มีในชีท)"""
+    for col, kind in schema.items():
+        if col not in df.columns:
+            continue
+        values = df[col]
+        if isinstance(kind, tuple):
+            df[col] = parse_sheet_dates(values, kind[1], dayfirst=kind[2])
+        elif kind == "text":
+            df[col] = values.astype(str).str.strip()
+        elif kind == "category":
+            df[col] = values.astype(str).str.strip().astype("category")
+        else:
+            df[col] = pd.to_numeric(values, errors="coerce").fillna(0).astype(kind)
+    return df
+
+def concat_frames(frames):
+    """ต่อ DataFrame หลายชุดโดยคงคอลัมน์ category ไว้ (pd.concat จะแปลงเป็น object หากชุดค่าต่างกัน)"""
+    frames = [frame for frame in frames if not frame.empty] or frames[:1]
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    for col in frames[0].columns:
+        if not isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            continue
+        parts = [frame[col].astype("category") for frame in frames]
+        categories = pd.api.types.union_categoricals(parts, ignore_order=True).categories
+        frames = [
+            frame.assign(**{col: part.cat.set_categories(categories)})
+            for frame, part in zip(frames, parts)
+        ]
+    return pd.concat(frames, ignore_index=True)
 
-@st.cache_data(ttl=300)  # ตั้งค่า TTL เป็น 5 นาที
+@instrumented_cache_data(ttl=300)  # ตั้งค่า TTL เป็น 5 นาที
 def load_product_data():
     """โหลดและทำความสะอาดข้อมูลสินค้าจาก Google Sheets"""
     try:
@@ -324,11 +1262,8 @@ def load_product_data():
         if not gc:
             return pd.DataFrame()
             
-        sheet = gc.open_by_key(SHEET_ID)
-        worksheet = sheet.worksheet("ตู้เย็น")
-        
         # ใช้ get_all_values แทน get_all_records เพื่อควบคุมการแปลงข้อมูล
-        data = worksheet.get_all_values()
+        data = read_sheet_values("ตู้เย็น")
         if len(data) < 2:  # ต้องมี header และอย่างน้อย 1 แถวข้อมูล
             return pd.DataFrame()
             
@@ -345,15 +1280,19 @@ def load_product_data():
             st.error(f"❌ โครงสร้างข้อมูลไม่ครบ: ขาดคอลัมน์ {', '.join(missing)}")
             return pd.DataFrame()
 
-        # ทำความสะอาดข้อมูล
-        df["ชื่อสินค้า"] = df["ชื่อสินค้า"].astype(str).str.strip()
-        numeric_cols = ["ราคาขาย", "ต้นทุน", "เข้า", "ออก", "คงเหลือในตู้"]
-        for col in numeric_cols:
-            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+        # ทำความสะอาดข้อมูล (ตัวนับสต็อกเป็นจำนวนเต็ม ตัดทศนิยมแบบเดียวกับ safe_int)
+        apply_sheet_schema(df, PRODUCT_SCHEMA)
             
         # คำนวณสต็อกหากไม่มีคอลัมน์คงเหลือ
         if "คงเหลือในตู้" not in df.columns:
             df["คงเหลือในตู้"] = df["เข้า"] - df["ออก"]
+
+        # คอลัมน์สต็อกที่คำนวณล่วงหน้าสำหรับ Dashboard
+        df["คงเหลือ"] = df["เข้า"] - df["ออก"]
+        df["สัดส่วนคงเหลือ"] = (df["คงเหลือ"] / df["เข้า"].where(df["เข้า"] > 0)).fillna(0).clip(0, 1)
+
+        # รหัสของการโหลดครั้งนี้ ใช้เป็นคีย์ของดัชนีที่สร้างจาก DataFrame นี้
+        df.attrs["load_id"] = uuid.uuid4().hex
             
         return df
     except Exception as e:
@@ -361,7 +1300,89 @@ def load_product_data():
         logger.error(f"Error loading product data: {e}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=60)
+PRODUCT_SEARCH_LIMIT = 50  # จำนวนผลค้นหาสินค้าสูงสุดที่แสดง
+SEARCH_IGNORED_CHARS = dict.fromkeys(map(ord, "\u200b\u200c\u200d\u2060\ufeff"))  # อักขระความกว้างศูนย์
+
+def normalize_search_text(text):
+    """ปรับรูปข้อความสำหรับค้นหา (NFC, ตัดอักขระความกว้างศูนย์, นิคหิต+สระอา -> สระอำ, ไม่สนตัวพิมพ์, ยุบช่องว่าง)"""
+    text = unicodedata.normalize("NFC", str(text)).translate(SEARCH_IGNORED_CHARS)
+    text = text.replace("\u0e4d\u0e32", "\u0e33")
+    return " ".join(text.casefold().split())
+
+def search_grams(text):
+    """ตัวอักษรเดี่ยวและคู่ตัวอักษรติดกันของข้อความที่ปรับรูปแล้ว"""
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+class ProductSearchIndex:
+    """ดัชนีค้นหาชื่อสินค้าแบบ n-gram (ค้นหาเป็นข้อความธรรมดา ไม่ใช่ regex) พร้อมจัดอันดับผลลัพธ์"""
+
+    def __init__(self, names):
+        self.names = list(dict.fromkeys(str(name) for name in names if str(name).strip()))
+        self.keys = [normalize_search_text(name) for name in self.names]
+        self.postings = {}  # n-gram -> ตำแหน่งของสินค้าใน self.names
+        for pos, key in enumerate(self.keys):
+            for gram in search_grams(key):
+                self.postings.setdefault(gram, set()).add(pos)
+
+    def search(self, query, limit=PRODUCT_SEARCH_LIMIT):
+        """ชื่อสินค้าที่มีคำค้นหา เรียงจากตรงทั้งชื่อ ขึ้นต้นชื่อ ขึ้นต้นคำ แล้วจึงพบกลางคำ (คำค้นหาว่างคืนทุกสินค้า)"""
+        query = normalize_search_text(query)
+        if not query:
+            return self.names[:limit] if limit else list(self.names)
+
+        grams = {query} if len(query) == 1 else {query[i:i + 2] for i in range(len(query) - 1)}
+        postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+        matches = []
+        for pos in postings[0].intersection(*postings[1:]):
+            key = self.keys[pos]
+            at = key.find(query)
+            if at < 0:
+                continue
+            rank = 0 if key == query else 1 if at == 0 else 2 if key[at - 1] == " " else 3
+            matches.append((rank, at, len(key), pos))
+        best = heapq.nsmallest(limit, matches) if limit else sorted(matches)
+        return [self.names[match[3]] for match in best]
+
+def product_search_index(df) -> ProductSearchIndex:
+    """ดัชนีค้นหาของข้อมูลสินค้าที่โหลด (สร้างใหม่เฉพาะเมื่อโหลดข้อมูลสินค้าชุดใหม่)"""
+    return build_product_search_index(df.attrs.get("load_id"), df)
+
+@st.cache_resource(max_entries=2)
+def build_product_search_index(load_id, _df) -> ProductSearchIndex:
+    """สร้างดัชนีค้นหาชื่อสินค้า (แคชตาม load_id เพื่อไม่ต้องคัดลอกดัชนีทุกครั้งที่ rerun)"""
+    return ProductSearchIndex(_df["ชื่อสินค้า"] if "ชื่อสินค้า" in _df.columns else [])
+
+class ProductRecords:
+    """ดัชนีจากชื่อสินค้าไปยังราคาขาย ต้นทุน สต็อกคงเหลือ และเลขแถวในชีทตู้เย็น"""
+
+    def __init__(self, df):
+        self.records = {}
+        if not df.empty:
+            # แถวลำดับที่ i ของ DataFrame คือแถว i + 2 ในชีท และชื่อซ้ำใช้แถวแรก
+            for sheet_row, name, price, cost, stock in zip(
+                range(2, len(df) + 2), df["ชื่อสินค้า"], df["ราคาขาย"], df["ต้นทุน"], df["คงเหลือในตู้"]
+            ):
+                self.records.setdefault(name, {
+                    "price": float(price),
+                    "cost": float(cost),
+                    "stock": int(stock),
+                    "sheet_row": sheet_row,
+                })
+
+    def get(self, name):
+        """ข้อมูลของสินค้า (price, cost, stock, sheet_row) หรือ None หากไม่พบ"""
+        return self.records.get(name)
+
+def product_records(df) -> ProductRecords:
+    """ดัชนีข้อมูลสินค้าตามชื่อของข้อมูลสินค้าที่โหลด (สร้างใหม่เฉพาะเมื่อโหลดข้อมูลสินค้าชุดใหม่)"""
+    return build_product_records(df.attrs.get("load_id"), df)
+
+@st.cache_resource(max_entries=2)
+def build_product_records(load_id, _df) -> ProductRecords:
+    """สร้างดัชนีข้อมูลสินค้าตามชื่อ (แคชตาม load_id เช่นเดียวกับดัชนีค้นหา)"""
+    return ProductRecords(_df)
+
+@instrumented_cache_data(ttl=60)
 def load_customer_debt_data():
     """โหลดข้อมูลลูกค้าค้างเงิน"""
     try:
@@ -369,13 +1390,12 @@ def load_customer_debt_data():
         if not gc:
             return pd.DataFrame()
             
-        sheet = gc.open_by_key(SHEET_ID)
         try:
-            worksheet = sheet.worksheet("ลูกค้าค้างเงิน")
-            df = pd.DataFrame(worksheet.get_all_records())
+            df = pd.DataFrame(values_to_records(read_sheet_values("ลูกค้าค้างเงิน")))
+            apply_sheet_schema(df, CUSTOMER_DEBT_SCHEMA)
         except gspread.WorksheetNotFound:
             # สร้างชีทใหม่หากไม่พบ
-            worksheet = sheet.add_worksheet(title="ลูกค้าค้างเงิน", rows=100, cols=10)
+            worksheet = add_worksheet("ลูกค้าค้างเงิน", rows=100, cols=10)
             df = pd.DataFrame(columns=[
                 "วันที่",
                 "ชื่อลูกค้า",
@@ -393,7 +1413,7 @@ def load_customer_debt_data():
         handle_error(e, "การโหลดข้อมูลลูกค้าค้างเงิน")
         return pd.DataFrame()
 
-@st.cache_data(ttl=60)
+@instrumented_cache_data(ttl=60)
 def load_customer_summary():
     """โหลดข้อมูลสรุปยอดค้างสะสม"""
     try:
@@ -401,13 +1421,11 @@ def load_customer_summary():
         if not gc:
             return pd.DataFrame()
             
-        sheet = gc.open_by_key(SHEET_ID)
         try:
-            worksheet = sheet.worksheet("สรุปยอดค้าง")
-            df = pd.DataFrame(worksheet.get_all_records())
+            df = pd.DataFrame(values_to_records(read_sheet_values("สรุปยอดค้าง")))
         except gspread.WorksheetNotFound:
             # สร้างชีทใหม่หากไม่พบ
-            worksheet = sheet.add_worksheet(title="สรุปยอดค้าง", rows=100, cols=10)
+            worksheet = add_worksheet("สรุปยอดค้าง", rows=100, cols=10)
             df = pd.DataFrame(columns=[
                 "ชื่อลูกค้า",
                 "สายส่ง",
@@ -419,79 +1437,357 @@ def load_customer_summary():
             worksheet.update([df.columns.tolist()] + df.values.tolist())
             return df
         
-        return df
+        return apply_sheet_schema(df, CUSTOMER_SUMMARY_SCHEMA)
     except Exception as e:
         handle_error(e, "การโหลดข้อมูลสรุปยอดค้าง")
         return pd.DataFrame()
 
-@st.cache_data(ttl=60)
-def load_sales_data() -> pd.DataFrame:
-    """โหลดข้อมูลยอดขายจาก Google Sheets"""
+class CustomerDirectory:
+    """ข้อมูลสรุปยอดค้าง พร้อม index ตาม (สายส่ง, ชื่อลูกค้า) และรายชื่อลูกค้าแยกตามสายส่ง"""
+
+    def __init__(self, df):
+        self.df = df
+        self.rows = {}       # (สายส่ง, ชื่อลูกค้า) -> index ของแถวใน df
+        self.by_chain = {}   # สายส่ง -> รายชื่อลูกค้าตามลำดับในชีท
+        if "ชื่อลูกค้า" in df.columns and "สายส่ง" in df.columns:
+            for label, name, chain in zip(df.index, df["ชื่อลูกค้า"], df["สายส่ง"]):
+                key = (str(chain).strip(), str(name).strip())
+                if not key[1] or key in self.rows:
+                    continue
+                self.rows[key] = label
+                self.by_chain.setdefault(key[0], []).append(key[1])
+
+    def names(self, chain):
+        """รายชื่อลูกค้าของสายส่ง"""
+        return self.by_chain.get(chain, [])
+
+    def balance(self, chain, name):
+        """ยอดค้างคงเหลือของลูกค้า หรือ None หากไม่พบลูกค้า"""
+        idx = self.rows.get((chain, name))
+        if idx is None or "ยอดค้างคงเหลือ" not in self.df.columns:
+            return None
+        return safe_float(self.df.at[idx, "ยอดค้างคงเหลือ"])
+
+@instrumented_cache_data(ttl=60)
+def load_customer_directory() -> CustomerDirectory:
+    """สมุดรายชื่อลูกค้าจากชีทสรุปยอดค้าง (ค้นหาโดยไม่ต้องเรียก API)"""
+    return CustomerDirectory(load_customer_summary())
+
+def dedupe_headers(headers):
+    """แก้ไขชื่อคอลัมน์ว่างหรือซ้ำ (แก้ปัญหาชื่อคอลัมน์ซ้ำ)"""
+    headers = list(headers)
+    seen = {}
+    for i, h in enumerate(headers):
+        if h == '':  # ถ้า header ว่างเปล่า
+            headers[i] = f"Unnamed_{i}"
+        elif h in seen:
+            seen[h] += 1
+            headers[i] = f"{h}_{seen[h]}"
+        else:
+            seen[h] = 1
+    return headers
+
+def trim_row(row):
+    """ตัดเซลล์ว่างท้ายแถวออก (Sheets API ไม่ส่งเซลล์ว่างท้ายแถวกลับมา)"""
+    row = list(row)
+    while row and row[-1] == "":
+        row.pop()
+    return row
+
+def build_sales_frame(columns, rows):
+    """สร้าง DataFrame ยอดขายจากแถวดิบพร้อมทำความสะอาดข้อมูล"""
+    # เติมแถวที่สั้นกว่า header (Sheets ตัดเซลล์ว่างท้ายแถวออก)
+    width = len(columns)
+    rows = [(list(row) + [""] * width)[:width] for row in rows]
+    df = pd.DataFrame(rows, columns=columns)
+
+    # ตรวจสอบและเพิ่มคอลัมน์ "ประเภท" หากไม่มี
+    if "ประเภท" not in df.columns:
+        df["ประเภท"] = "drink"  # ค่าเริ่มต้น
+
+    return apply_sheet_schema(df, SALES_SCHEMA)
+
+SALE_ITEM_COLUMNS = ["sale_id", "timestamp", "product", "qty", "price", "category"]
+
+def build_sale_items(sales, first_row):
+    """แตกคอลัมน์รายการของยอดขายเป็นตารางรายการสินค้า (sale_id คือเลขแถวในชีทยอดขาย)"""
+    if sales.empty or "รายการ" not in sales.columns:
+        return pd.DataFrame(columns=SALE_ITEM_COLUMNS)
+
+    lines = pd.DataFrame({
+        "sale_id": np.arange(first_row, first_row + len(sales)),
+        "timestamp": sales["วันที่"].to_numpy() if "วันที่" in sales.columns else pd.NaT,
+        "category": sales["ประเภท"].to_numpy(),
+        "total": sales["ยอดขาย"].to_numpy() if "ยอดขาย" in sales.columns else np.nan,
+        "item": sales["รายการ"].astype(str).str.split(",").to_numpy(),
+    }).explode("item")
+    lines["item"] = lines["item"].str.strip()
+    lines = lines[lines["item"] != ""]
+
+    # "ชื่อสินค้า x จำนวน" สำหรับเครื่องดื่ม และ "น้ำแข็งโม่" สำหรับน้ำแข็ง
+    parts = lines["item"].str.rsplit(" x ", n=1, expand=True)
+    if parts.shape[1] < 2:
+        parts[1] = None
+    is_ice = lines["category"] == "ice"
+    lines["product"] = parts[0].str.strip().where(
+        ~is_ice,
+        lines["item"].str.split("(").str[0].str.replace("น้ำแข็ง", "", regex=False).str.strip()
+    )
+    lines["qty"] = pd.to_numeric(parts[1], errors="coerce").fillna(1).where(~is_ice, 1)
+
+    # ราคาต่อหน่วยจากยอดขายของบิลที่มีสินค้าเดียว
+    single_line = lines.groupby("sale_id")["item"].transform("size") == 1
+    lines["price"] = (lines["total"] / lines["qty"]).where(single_line)
+    lines["qty"] = lines["qty"].astype("float32")
+    lines["product"] = lines["product"].astype("category")
+    lines["category"] = lines["category"].astype("category")
+
+    return lines[SALE_ITEM_COLUMNS].reset_index(drop=True)
+
+SALES_ROLLUP_VALUES = ["ยอดขาย", "กำไร", "จำนวนรายการ"]
+
+def build_sales_rollups(sales):
+    """รวมยอดขาย กำไร และจำนวนรายการ รายชั่วโมง/รายเดือน แยกตามประเภท (ยอดรายวันตัดจากรายชั่วโมง)"""
+    if sales.empty or "วันที่" not in sales.columns or "ยอดขาย" not in sales.columns:
+        return {}
+
+    values = pd.DataFrame({
+        "ยอดขาย": sales["ยอดขาย"],
+        "กำไร": sales["กำไร"] if "กำไร" in sales.columns else 0.0,
+        "จำนวนรายการ": 1,
+    })
+    dates = sales["วันที่"]
+    periods = {
+        "hour": dates.dt.floor("h"),
+        "month": dates.dt.to_period("M").dt.to_timestamp(),
+    }
+    return {
+        name: values.groupby([period.rename("ช่วงเวลา"), sales["ประเภท"].astype(str)], dropna=False).sum().sort_index()
+        for name, period in periods.items()
+    }
+
+def merge_sales_rollups(current, new):
+    """บวกยอดรวมของแถวใหม่เข้ากับยอดรวมเดิม"""
+    if not current:
+        return new
+    if not new:
+        return current
+    return {
+        name: current[name].add(new[name], fill_value=0).sort_index()
+        for name in current
+    }
+
+class SalesLedger:
+    """เก็บข้อมูลชีทยอดขายในหน่วยความจำ และดึงเฉพาะแถวใหม่ต่อท้ายเมื่อรีเฟรช"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+        self.use_mirror = True  # โหลดครั้งแรกจากสำเนา local ได้
+
+    def reset(self):
+        """ล้างข้อมูลทั้งหมด เพื่อให้รีเฟรชครั้งถัดไปโหลดใหม่ทั้งชีท"""
+        self.headers = None      # header ดิบจากชีท
+        self.columns = None      # header ที่แก้ชื่อซ้ำแล้ว
+        self.last_row = 0        # เลขแถวสุดท้ายในชีทที่โหลดแล้ว
+        self.last_values = None  # ค่าดิบของแถวสุดท้าย ใช้ตรวจว่าชีทถูกแก้ไขย้อนหลังหรือไม่
+        self.df = pd.DataFrame()
+        self.items = pd.DataFrame(columns=SALE_ITEM_COLUMNS)  # ตารางรายการสินค้าที่แตกจากคอลัมน์รายการ
+        self.rollups = {}        # ยอดรวมรายชั่วโมง/รายเดือน แยกตามประเภท
+        self.use_mirror = False  # ผู้ใช้สั่งโหลดใหม่ ต้องดึงจาก Google Sheets
+        self.refreshed_at = 0.0  # เวลาที่ดึงแถวใหม่สำเร็จครั้งล่าสุด
+
+    def mark_stale(self):
+        """ให้รีเฟรชครั้งถัดไปดึงแถวใหม่ทันที (เช่นหลังเขียนยอดขายใหม่)"""
+        with self._lock:
+            self.refreshed_at = 0.0
+
+    def refresh(self, worksheet):
+        """ดึงเฉพาะแถวที่เพิ่มเข้ามาใหม่ตั้งแต่ครั้งก่อน แล้วคืนค่า DataFrame ทั้งหมด"""
+        with self._lock:
+            if self.headers is None:
+                self._load_full(worksheet)
+                self.refreshed_at = time.time()
+                return self.df
+            # loader ยอดขายหลายตัวที่หมดอายุพร้อมกันใช้ผลการดึงครั้งเดียว
+            if time.time() - self.refreshed_at < SALES_LEDGER_MAX_AGE:
+                return self.df
+            try:
+                self._load_tail(worksheet)
+                self.refreshed_at = time.time()
+            except Exception as e:
+                # ใช้ข้อมูลที่มีอยู่ระหว่างที่เครือข่ายมีปัญหา
+                if self.df.empty:
+                    raise
+                logger.warning(f"Sales ledger refresh failed, serving cached rows: {e}")
+            return self.df
+
+    def _load_full(self, worksheet):
+        mirror = get_sheet_mirror()
+        if mirror is not None and self.use_mirror and mirror.has("ยอดขาย", fresh=False):
+            # เริ่มจากสำเนา local แล้วดึงเฉพาะแถวที่ขาดจาก Google Sheets
+            self.use_mirror = False
+            if self._load_chunks(mirror.iter_rows("ยอดขาย")):
+                logger.info(f"Sales ledger loaded {len(self.df)} rows from local mirror")
+                try:
+                    self._load_tail(worksheet)
+                except Exception as e:
+                    logger.warning(f"Sales ledger catch-up failed, serving mirror rows: {e}")
+                return
+
+        chunks = iter_sheet_rows(worksheet)
+        if mirror is not None:
+            # เขียนสำเนาใหม่ทีละช่วง หากโหลดไม่ครบ รอบถัดไปจะดึงแถวที่ขาดต่อจากสำเนา
+            mirror.store("ยอดขาย", [])
+            chunks = self._store_chunks(mirror, chunks)
+        if not self._load_chunks(chunks):
+            self.reset()
+            return
+        logger.info(f"Sales ledger loaded {len(self.df)} rows")
+
+    @staticmethod
+    def _store_chunks(mirror, chunks):
+        for first_row, rows in chunks:
+            mirror.store_rows("ยอดขาย", first_row, rows)
+            yield first_row, rows
+
+    def _load_tail(self, worksheet):
+        # ดึง header, แถวสุดท้ายที่รู้จัก และแถวใหม่ทั้งหมดในคำขอเดียว
+        end_col = gspread.utils.rowcol_to_a1(1, len(self.headers)).rstrip("0123456789")
+        header, last, tail = worksheet.batch_get([
+            "1:1",
+            f"A{self.last_row}:{end_col}{self.last_row}",
+            f"A{self.last_row + 1}:{end_col}",
+        ])
+        header = trim_row(header[0]) if header else []
+        last = trim_row(last[0]) if last else []
+
+        # ชีทถูกแก้ไขหรือลบแถวย้อนหลัง ต้องโหลดใหม่ทั้งหมด
+        if header != trim_row(self.headers) or (self.last_row > 1 and last != self.last_values):
+            logger.info("Sales sheet changed in place, reloading in full")
+            self._load_full(worksheet)
+            return
+
+        # ตัดแถวว่างท้ายชีทออก
+        while tail and not any(tail[-1]):
+            tail.pop()
+        if not tail:
+            return
+
+        mirror = get_sheet_mirror()
+        if mirror is not None:
+            mirror.store_rows("ยอดขาย", self.last_row + 1, tail)
+
+        new_df = build_sales_frame(self.columns, tail)
+        new_items = build_sale_items(new_df, self.last_row + 1)
+        self.df = concat_frames([self.df, new_df])
+        self.items = concat_frames([self.items, new_items])
+        self.rollups = merge_sales_rollups(self.rollups, build_sales_rollups(new_df))
+        self.last_row += len(tail)
+        self.last_values = trim_row(tail[-1])
+        logger.info(f"Sales ledger appended {len(tail)} new rows")
+
+    def _load_chunks(self, chunks):
+        """สร้าง DataFrame รายการสินค้า และยอดรวม ทีละช่วงแถว (ไม่เก็บแถวดิบทั้งชีทไว้พร้อมกัน) คืนค่า False หากชีทว่าง"""
+        headers = None
+        frames, item_frames, rollups = [], [], {}
+        last_row, last_values = 1, None
+        for first_row, rows in chunks:
+            if headers is None:
+                headers = rows[0]
+                columns = dedupe_headers(headers)
+                first_row, rows = first_row + 1, rows[1:]
+                if not rows:
+                    continue
+            df = build_sales_frame(columns, rows)
+            frames.append(df)
+            items = build_sale_items(df, first_row)
+            if not items.empty:
+                item_frames.append(items)
+            rollups = merge_sales_rollups(rollups, build_sales_rollups(df))
+            last_row = first_row + len(rows) - 1
+            last_values = trim_row(rows[-1])
+        if headers is None:
+            return False
+
+        self.headers = list(headers)
+        self.columns = columns
+        self.df = concat_frames(frames) if frames else build_sales_frame(columns, [])
+        self.items = concat_frames(item_frames) if item_frames else pd.DataFrame(columns=SALE_ITEM_COLUMNS)
+        self.rollups = rollups
+        self.last_row = last_row
+        self.last_values = last_values if last_values is not None else trim_row(headers)
+        return True
+
+@st.cache_resource
+def get_sales_ledger():
+    """ข้อมูลยอดขายที่โหลดแล้ว ใช้ร่วมกันทุก session"""
+    return SalesLedger()
+
+def refresh_sales_ledger():
+    """ดึงแถวใหม่ของชีทยอดขายเข้า ledger แล้วคืนค่า ledger (คืนค่า None หากเชื่อมต่อไม่ได้)"""
     try:
         gc = connect_google_sheets()
         if not gc:
-            return pd.DataFrame()
-            
-        sheet = gc.open_by_key(SHEET_ID)
-        worksheet = sheet.worksheet("ยอดขาย")
-        
-        # 1. ดึงข้อมูลทั้งหมดแบบ raw
-        data = worksheet.get_all_values()
-        
-        if len(data) < 1:
-            return pd.DataFrame()
-        
-        # 2. กำหนด header เอง (แก้ปัญหาชื่อคอลัมน์ซ้ำ)
-        headers = data[0]
-        
-        # ตรวจสอบและแก้ไข header ซ้ำ
-        seen = {}
-        for i, h in enumerate(headers):
-            if h == '':  # ถ้า header ว่างเปล่า
-                headers[i] = f"Unnamed_{i}"
-            elif h in seen:
-                seen[h] += 1
-                headers[i] = f"{h}_{seen[h]}"
-            else:
-                seen[h] = 1
-                
-        # 3. สร้าง DataFrame ด้วย header ที่แก้ไขแล้ว
-        df = pd.DataFrame(data[1:], columns=headers)
-        
-        # 4. ทำความสะอาดคอลัมน์ตัวเลข
-        numeric_cols = ["ยอดขาย", "กำไร"]
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
-                
-        # 5. ตรวจสอบและเพิ่มคอลัมน์ "ประเภท" หากไม่มี
-        if "ประเภท" not in df.columns:
-            df["ประเภท"] = "drink"  # ค่าเริ่มต้น
+            return None
             
-        # 6. แปลงคอลัมน์วันที่
-        if "วันที่" in df.columns:
-            try:
-                df["วันที่"] = pd.to_datetime(df["วันที่"], errors="coerce")
-            except:
-                pass
-
-        return df
+        worksheet = get_worksheet("ยอดขาย")
+        ledger = get_sales_ledger()
+        ledger.refresh(worksheet)
+        return ledger
 
     except Exception as e:
         handle_error(e, "การโหลดข้อมูลยอดขาย")
-        return pd.DataFrame()
+        return None
 
-@st.cache_data(ttl=60)
-def load_ice_data():
-    """โหลดและทำความสะอาดข้อมูลน้ำแข็งจาก Google Sheets"""
+@instrumented_cache_data(ttl=60)
+def load_sales_data() -> pd.DataFrame:
+    """โหลดข้อมูลยอดขายจาก Google Sheets (ดึงเฉพาะแถวใหม่หลังโหลดครั้งแรก)"""
+    ledger = refresh_sales_ledger()
+    return ledger.df if ledger else pd.DataFrame()
+
+@instrumented_cache_data(ttl=60)
+def load_sale_items() -> pd.DataFrame:
+    """ตารางรายการสินค้าที่ขาย (sale_id, timestamp, product, qty, price, category)"""
+    ledger = refresh_sales_ledger()
+    return ledger.items if ledger else pd.DataFrame(columns=SALE_ITEM_COLUMNS)
+
+@instrumented_cache_data(ttl=60)
+def load_sales_rollups():
+    """ยอดรวมรายชั่วโมง/รายเดือนของชีทยอดขาย พร้อมรายชื่อคอลัมน์ของชีท"""
+    ledger = refresh_sales_ledger()
+    if not ledger:
+        return {"columns": [], "rollups": {}}
+    return {"columns": list(ledger.columns or []), "rollups": ledger.rollups}
+
+def ice_key(name):
+    """ชื่อชนิดน้ำแข็งแบบมาตรฐาน (ตัดช่องว่าง ตัวพิมพ์เล็ก และตัดคำว่า 'น้ำแข็ง')"""
+    return str(name).replace("น้ำแข็ง", "").replace(" ", "").strip().lower()
+
+class IceState:
+    """ข้อมูลชีท iceflow พร้อม index จากชื่อชนิดน้ำแข็งแบบมาตรฐานไปยังแถวของ DataFrame"""
+
+    def __init__(self, df):
+        self.df = df
+        self.rows = {}
+        if "ชนิดน้ำแข็ง" in df.columns:
+            for label, name in zip(df.index, df["ชนิดน้ำแข็ง"]):
+                # ชื่อซ้ำใช้แถวแรก เหมือนที่หน้าจอเดิมใช้
+                self.rows.setdefault(ice_key(name), label)
+
+    def row(self, ice_type):
+        """index ของแถวน้ำแข็งชนิดที่ระบุ หรือ None หากไม่พบ"""
+        return self.rows.get(ice_key(ice_type))
+
+@instrumented_cache_data(ttl=60)
+def load_ice_data() -> IceState:
+    """โหลดและทำความสะอาดข้อมูลน้ำแข็งจาก Google Sheets พร้อม index ชนิดน้ำแข็ง"""
     try:
         gc = connect_google_sheets()
         if not gc:
-            return pd.DataFrame()
+            return IceState(pd.DataFrame())
             
-        sheet = gc.open_by_key(SHEET_ID)
-        worksheet = sheet.worksheet("iceflow")
-        df_ice = pd.DataFrame(worksheet.get_all_records())
+        df_ice = pd.DataFrame(values_to_records(read_sheet_values("iceflow")))
         
         if df_ice.empty:
             # สร้าง DataFrame เปล่าพร้อมคอลัมน์ที่จำเป็น
@@ -499,7 +1795,7 @@ def load_ice_data():
                 "ชนิดน้ำแข็ง", "ราคาขายต่อหน่วย", "ต้นทุนต่อหน่วย",
                 "รับเข้า", "ขายออก", "จำนวนละลาย", "กำไรสุทธิ", "ยอดขายรวม", "วันที่"
             ]
-            return pd.DataFrame(columns=required_cols)
+            return IceState(pd.DataFrame(columns=required_cols))
             
         # ตรวจสอบและเพิ่มคอลัมน์ที่จำเป็นหากไม่มี
         required_cols = {
@@ -529,7 +1825,7 @@ def load_ice_data():
             if col in df_ice.columns:
                 df_ice[col] = pd.to_numeric(df_ice[col], errors='coerce').fillna(0)
             
-        return df_ice
+        return IceState(df_ice)
     except Exception as e:
         st.error(f"เกิดข้อผิดพลาดในการโหลดข้อมูลน้ำแข็ง: {str(e)}")
         logger.error(f"Error loading ice data: {e}")
@@ -538,9 +1834,9 @@ def load_ice_data():
             "ชนิดน้ำแข็ง", "ราคาขายต่อหน่วย", "ต้นทุนต่อหน่วย",
             "รับเข้า", "ขายออก", "จำนวนละลาย", "กำไรสุทธิ", "ยอดขายรวม", "วันที่"
         ]
-        return pd.DataFrame(columns=required_cols)
+        return IceState(pd.DataFrame(columns=required_cols))
 
-@st.cache_data(ttl=60)
+@instrumented_cache_data(ttl=60)
 def load_delivery_data(chain_name: str) -> pd.DataFrame:
     """โหลดข้อมูลการส่งน้ำแข็งสำหรับสายส่งที่ระบุ"""
     try:
@@ -548,13 +1844,11 @@ def load_delivery_data(chain_name: str) -> pd.DataFrame:
         if not gc:
             return pd.DataFrame()
             
-        sheet = gc.open_by_key(SHEET_ID)
         try:
-            worksheet = sheet.worksheet(chain_name)
-            df = pd.DataFrame(worksheet.get_all_records())
+            df = pd.DataFrame(values_to_records(read_sheet_values(chain_name)))
         except gspread.WorksheetNotFound:
             # สร้างชีทใหม่หากไม่พบ
-            worksheet = sheet.add_worksheet(title=chain_name, rows=100, cols=20)
+            worksheet = add_worksheet(chain_name, rows=100, cols=20)
             df = pd.DataFrame(columns=[
                 "วันที่",
                 "น้ำแข็งโม่_ใช้",
@@ -581,7 +1875,7 @@ def load_delivery_data(chain_name: str) -> pd.DataFrame:
         if df.empty:
             return pd.DataFrame()
             
-        return df
+        return apply_sheet_schema(df, DELIVERY_SCHEMA)
     except Exception as e:
         handle_error(e, f"การโหลดข้อมูลการส่งน้ำแข็งสำหรับสาย {chain_name}")
         return pd.DataFrame()
@@ -592,9 +1886,9 @@ def load_delivery_data(chain_name: str) -> pd.DataFrame:
         for ice_type in ICE_TYPES:
             # หาราคาขายต่อถุง
             price = 0
-            row = ice_data[ice_data["ชนิดน้ำแข็ง"].str.contains(ice_type, na=False)]
-            if not row.empty:
-                price = safe_float(row.iloc[0]["ราคาขายต่อหน่วย"])
+            idx = ice_data.row(ice_type)
+            if idx is not None:
+                price = safe_float(ice_data.df.at[idx, "ราคาขายต่อหน่วย"])
             
             # คำนวณยอดขาย
             used = data.get(f"{ice_type}_ใช้", 0)
@@ -617,6 +1911,468 @@ def load_delivery_data(chain_name: str) -> pd.DataFrame:
         handle_error(e, f"การบันทึกข้อมูลการส่งน้ำแข็งสำหรับสาย {chain_name}")
         return False
 
+def clear_sheet_caches(*sheet_names):
+    """ล้างแคชเฉพาะฟังก์ชันโหลดข้อมูลที่อ่านจากชีทที่ระบุ"""
+    loaders_by_sheet = {
+        "ตู้เย็น": [load_product_data],
+        "ยอดขาย": [load_sales_data, load_sale_items, load_sales_rollups],
+        "iceflow": [load_ice_data],
+        "สรุปยอดค้าง": [load_customer_summary, load_customer_directory],
+        "ลูกค้าค้างเงิน": [load_customer_debt_data],
+    }
+    for sheet_name in sheet_names:
+        if sheet_name in DELIVERY_CHAINS:
+            load_delivery_data.clear(sheet_name)
+        for loader in loaders_by_sheet.get(sheet_name, []):
+            loader.clear()
+
+def invalidate_sheets(*sheet_names):
+    """ล้างแคชของชีทที่ถูกแก้ไข ทำเครื่องหมาย snapshot และสำเนา local ว่าเก่า"""
+    get_sheet_snapshots().mark_stale(*sheet_names)
+    mirror = get_sheet_mirror()
+    if mirror is not None:
+        for sheet_name in sheet_names:
+            # ชีทยอดขายเพิ่มต่อท้ายอย่างเดียว SalesLedger ดึงแถวใหม่เอง
+            if sheet_name != "ยอดขาย":
+                mirror.mark_stale(sheet_name)
+    if "ยอดขาย" in sheet_names:
+        get_sales_ledger().mark_stale()
+    clear_sheet_caches(*sheet_names)
+    logger.info(f"Invalidated cache for sheets: {', '.join(sheet_names)}")
+
+class SalesJournal:
+    """บันทึกการขายลงไฟล์ SQLite (fsync ทุกรายการ) ก่อนส่งขึ้น Google Sheets เบื้องหลัง"""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS journal (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL DEFAULT 0,
+                last_error TEXT
+            )
+        """)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value REAL NOT NULL)")
+        # เวลาที่เริ่มบันทึกรหัสรายการลงชีทรหัสรายการที่ส่งแล้ว (รายการที่เก่ากว่านี้มีรหัสเฉพาะในชีทยอดขาย)
+        self._conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('key_sheet_since', ?)", (time.time(),))
+        self._conn.commit()
+        self.key_sheet_since = self._conn.execute(
+            "SELECT value FROM meta WHERE name = 'key_sheet_since'"
+        ).fetchone()[0]
+
+    def append(self, kind, payload):
+        """เพิ่มรายการลง journal และคืนค่า idempotency key"""
+        key = uuid.uuid4().hex
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO journal (key, kind, payload, created_at) VALUES (?, ?, ?, ?)",
+                (key, kind, json.dumps(payload, ensure_ascii=False), time.time())
+            )
+        self.wakeup.set()
+        return key
+
+    def pending(self, limit):
+        """รายการที่รอส่ง เรียงตามลำดับที่บันทึก"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, key, kind, payload, created_at, attempts FROM journal "
+                "WHERE status = 'pending' AND next_attempt <= ? ORDER BY id LIMIT ?",
+                (time.time(), limit)
+            ).fetchall()
+        return [dict(row, payload=json.loads(row["payload"])) for row in rows]
+
+    def pending_count(self):
+        """จำนวนรายการที่ยังไม่ได้ส่งขึ้น Google Sheets"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM journal WHERE status = 'pending'"
+            ).fetchone()[0]
+
+    def oldest_pending_time(self):
+        """เวลาที่บันทึกรายการเก่าที่สุดที่ยังรอส่ง หรือ None หากไม่มี"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT MIN(created_at) FROM journal WHERE status = 'pending'"
+            ).fetchone()[0]
+
+    def failed_count(self):
+        """จำนวนรายการที่ส่งไม่สำเร็จเกินจำนวนครั้งที่กำหนด"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM journal WHERE status = 'failed'"
+            ).fetchone()[0]
+
+    def mark_done(self, ids):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE journal SET status = 'done', last_error = NULL WHERE id = ?",
+                [(i,) for i in ids]
+            )
+
+    def mark_failed(self, ids, error):
+        """เลื่อนการส่งครั้งถัดไปแบบ exponential backoff"""
+        with self._lock, self._conn:
+            for i in ids:
+                attempts = self._conn.execute(
+                    "SELECT attempts FROM journal WHERE id = ?", (i,)
+                ).fetchone()[0] + 1
+                delay = min(JOURNAL_MAX_BACKOFF, 2 ** attempts) * random.uniform(0.5, 1.0)
+                status = "failed" if attempts >= JOURNAL_MAX_ATTEMPTS else "pending"
+                self._conn.execute(
+                    "UPDATE journal SET attempts = ?, next_attempt = ?, status = ?, last_error = ? WHERE id = ?",
+                    (attempts, time.time() + delay, status, str(error), i)
+                )
+
+class JournalWorker(threading.Thread):
+    """เธรดเบื้องหลังที่ทยอยส่งรายการใน journal ขึ้น Google Sheets เป็นชุด"""
+
+    def __init__(self, journal):
+        super().__init__(name="journal-worker", daemon=True)
+        self.journal = journal
+        self.last_prune = 0.0
+
+    def run(self):
+        while True:
+            self.journal.wakeup.wait(JOURNAL_DRAIN_INTERVAL)
+            self.journal.wakeup.clear()
+            try:
+                while self.drain_once():
+                    pass
+                if time.time() - self.last_prune >= JOURNAL_KEY_PRUNE_INTERVAL:
+                    self.last_prune = time.time()
+                    prune_journal_keys(self.journal)
+            except Exception as e:
+                logger.error(f"Journal worker error: {e}")
+
+    def drain_once(self):
+        """ส่งรายการที่ค้างหนึ่งชุด คืนค่า True หากยังอาจมีรายการเหลือ"""
+        entries = self.journal.pending(JOURNAL_BATCH_SIZE)
+        if not entries:
+            return False
+        # รายการที่เคยล้มเหลวให้ส่งทีละรายการ เพื่อไม่ให้รายการเสียขวางทั้งชุด
+        if entries[0]["attempts"] > 0:
+            entries = entries[:1]
+        ids = [entry["id"] for entry in entries]
+        try:
+            apply_journal_entries(entries)
+        except Exception as e:
+            self.journal.mark_failed(ids, e)
+            logger.warning(f"Journal drain failed for {len(ids)} entries: {e}")
+            return False
+        self.journal.mark_done(ids)
+        logger.info(f"Journal drained {len(ids)} entries")
+        return True
+
+@st.cache_resource
+def get_counter_lock():
+    """ล็อกระดับโปรเซสสำหรับการอ่านค่าตัวนับในชีทแล้วเขียนค่าที่บวกส่วนต่างแล้วกลับ (ทุกอุปกรณ์ใช้เซิร์ฟเวอร์เดียวกัน)"""
+    return threading.Lock()
+
+@st.cache_resource
+def get_sales_journal():
+    """journal การขายที่ใช้ร่วมกันทุก session พร้อมเธรดส่งข้อมูลเบื้องหลัง"""
+    journal = SalesJournal(get_setting("SALES_JOURNAL_PATH", "sales_journal.db"))
+    JournalWorker(journal).start()
+    return journal
+
+def ice_counter_deltas(ice, df_before, df_after):
+    """ส่วนต่างของตัวนับน้ำแข็งแต่ละชนิดระหว่างข้อมูลก่อนและหลังแก้ไข (แถวเดียวกันตาม index ของ ice)"""
+    deltas = {}
+    for ice_type in ICE_TYPES:
+        idx = ice.row(ice_type)
+        if idx is None:
+            continue
+        column_deltas = {}
+        for col in ICE_COUNTER_COLS:
+            if col in df_after.columns:
+                delta = safe_float(df_after.at[idx, col]) - safe_float(df_before.at[idx, col])
+                if delta != 0:
+                    column_deltas[col] = delta
+        if column_deltas:
+            deltas[ice_type] = column_deltas
+    return deltas
+
+def record_sale(kind, payload):
+    """บันทึกการขายลง journal แล้วคืนค่าทันที (ส่งขึ้น Google Sheets เบื้องหลัง)"""
+    key = get_sales_journal().append(kind, payload)
+    logger.info(f"Journaled {kind} {key}")
+    return key
+
+def sheet_row_numbers(values, name_col):
+    """ชื่อ -> เลขแถวในชีท (เริ่มที่ 1) ของแถวแรกที่มีชื่อนั้น"""
+    rows = {}
+    for i, row in enumerate(values[1:], start=2):
+        if name_col < len(row):
+            rows.setdefault(str(row[name_col]).strip(), i)
+    return rows
+
+def find_ice_sheet_row(values, ice_type):
+    """หาเลขแถวในชีท iceflow ของน้ำแข็งชนิดที่ระบุ"""
+    name_col = values[0].index("ชนิดน้ำแข็ง")
+    for i, row in enumerate(values[1:], start=2):
+        if name_col < len(row) and ice_key(row[name_col]) == ice_key(ice_type):
+            return i
+    return None
+
+def stock_update_requests(worksheet, values, qty_by_item):
+    """คำขอตัดสต็อกเครื่องดื่ม คำนวณจากค่าปัจจุบันในชีทตู้เย็น"""
+    headers = values[0]
+    name_col = headers.index("ชื่อสินค้า")
+    out_col = headers.index("ออก")
+    left_col = headers.index("คงเหลือในตู้")
+
+    # ใช้ค่าที่เพิ่งอ่านจากชีท (ไม่ใช่ข้อมูลในแคช) เพราะแถวอาจถูกเพิ่ม/ย้ายหลังโหลด
+    row_numbers = sheet_row_numbers(values, name_col)
+    requests = []
+    for item, qty in qty_by_item.items():
+        row_number = row_numbers.get(item)
+        if row_number is None:
+            raise ValueError(f"ไม่พบสินค้า {item} ในชีทตู้เย็น")
+        row = values[row_number - 1]
+        new_out = safe_int(row[out_col]) + qty
+        new_left = safe_int(row[left_col]) - qty
+        requests.append(update_cells_request(worksheet, row_number, out_col + 1, [new_out]))
+        requests.append(update_cells_request(worksheet, row_number, left_col + 1, [new_left]))
+    return requests
+
+def ice_delta_requests(worksheet, values, deltas):
+    """คำขอเพิ่มยอดตัวนับน้ำแข็งตามส่วนต่าง คำนวณจากค่าปัจจุบันในชีท iceflow"""
+    headers = values[0]
+    requests = []
+    for ice_type, column_deltas in deltas.items():
+        row_number = find_ice_sheet_row(values, ice_type)
+        if row_number is None:
+            raise ValueError(f"ไม่พบน้ำแข็ง{ice_type} ในชีท iceflow")
+        row = list(values[row_number - 1]) + [""] * len(headers)
+        current = {col: safe_float(row[headers.index(col)]) for col in ICE_COUNTER_COLS if col in headers}
+        for col, delta in column_deltas.items():
+            if col in current:
+                current[col] += delta
+                requests.append(update_cells_request(worksheet, row_number, headers.index(col) + 1, [current[col]]))
+        if "คงเหลือตอนเย็น" in headers:
+            remaining = current.get("รับเข้า", 0) - current.get("ขายออก", 0) - current.get("จำนวนละลาย", 0)
+            requests.append(update_cells_request(worksheet, row_number, headers.index("คงเหลือตอนเย็น") + 1, [remaining]))
+    return requests
+
+def ice_reset_requests(worksheet, values, today_str):
+    """คำขอรีเซ็ตยอดน้ำแข็งสำหรับวันใหม่ คำนวณจากค่าปัจจุบันในชีท iceflow (ข้ามแถวที่รีเซ็ตวันนี้แล้ว)"""
+    if not values:
+        return []
+    headers = values[0]
+    today = pd.to_datetime(today_str, dayfirst=True).date()
+    reset_cols = [col for col in ICE_COUNTER_COLS + ["คงเหลือตอนเย็น"] if col in headers]
+    date_col = headers.index("วันที่") if "วันที่" in headers else None
+    requests = []
+    for ice_type in ICE_TYPES:
+        row_number = find_ice_sheet_row(values, ice_type)
+        if row_number is None:
+            continue
+        row = list(values[row_number - 1]) + [""] * len(headers)
+        if date_col is not None:
+            # อีก session รีเซ็ตไปแล้วและอาจมียอดขายของวันนี้เข้ามาแล้ว ห้ามล้างซ้ำ
+            if pd.to_datetime(row[date_col], dayfirst=True, errors="coerce") == pd.Timestamp(today):
+                continue
+            requests.append(update_cells_request(worksheet, row_number, date_col + 1, [today_str]))
+        for col in reset_cols:
+            requests.append(update_cells_request(worksheet, row_number, headers.index(col) + 1, [0]))
+    return requests
+
+def get_journal_key_worksheet():
+    """ชีทรหัสรายการ journal ที่ส่งขึ้นแล้ว (สร้างพร้อม header หากยังไม่มี)"""
+    try:
+        return get_worksheet(JOURNAL_KEY_SHEET)
+    except gspread.WorksheetNotFound:
+        worksheet = add_worksheet(JOURNAL_KEY_SHEET, rows=100, cols=len(JOURNAL_KEY_HEADERS))
+        worksheet.append_row(JOURNAL_KEY_HEADERS)
+        return worksheet
+
+def journal_deltas(entries):
+    """รวมจำนวนเครื่องดื่มที่ขายและส่วนต่างตัวนับน้ำแข็งของทุกรายการในชุด"""
+    qty_by_item = {}
+    ice_deltas = {}
+    for entry in entries:
+        payload = entry["payload"]
+        for item, qty in payload.get("items", []):
+            qty_by_item[item] = qty_by_item.get(item, 0) + qty
+        for ice_type, column_deltas in payload.get("ice_deltas", {}).items():
+            merged = ice_deltas.setdefault(ice_type, {})
+            for col, delta in column_deltas.items():
+                merged[col] = merged.get(col, 0) + delta
+    return qty_by_item, ice_deltas
+
+def prune_journal_keys(journal):
+    """ลบแถวเก่าในชีทรหัสรายการที่ส่งแล้ว เก็บไว้เฉพาะช่วงที่รายการใน journal ยังอาจถูกส่งใหม่"""
+    cutoff = time.time() - JOURNAL_KEY_RETENTION
+    oldest = journal.oldest_pending_time()
+    if oldest is not None:
+        # ห้ามลบรหัสของรายการที่ยังค้างอยู่ แม้ค้างนานเกินช่วงที่เก็บไว้ (เช่นเซิร์ฟเวอร์ปิดไปหลายวัน)
+        cutoff = min(cutoff, oldest)
+    cutoff_str = datetime.datetime.fromtimestamp(cutoff, timezone(TIMEZONE)).strftime("%Y-%m-%d %H:%M:%S")
+
+    key_ws = get_journal_key_worksheet()
+    with get_counter_lock():
+        # แถวเรียงตามเวลาที่ส่ง นับแถวต้นชีทที่เก่ากว่า cutoff
+        stale = 0
+        for row in key_ws.get("C2:C"):
+            if not row or row[0] >= cutoff_str:
+                break
+            stale += 1
+        if not stale:
+            return
+        commit_sheet_requests([{
+            "deleteDimension": {
+                "range": {"sheetId": key_ws.id, "dimension": "ROWS", "startIndex": 1, "endIndex": 1 + stale}
+            }
+        }])
+    logger.info(f"Pruned {stale} rows from {JOURNAL_KEY_SHEET}")
+
+def apply_journal_entries(entries):
+    """ส่งรายการขายจาก journal ขึ้น Google Sheets ใน batchUpdate เดียว"""
+    spreadsheet = get_spreadsheet()
+    if spreadsheet is None:
+        raise ConnectionError("ไม่สามารถเชื่อมต่อ Google Sheet ได้")
+    summary_ws = get_worksheet("ยอดขาย")
+    key_ws = get_journal_key_worksheet()
+    qty_by_item, ice_deltas = journal_deltas(entries)
+
+    # อ่าน-คำนวณ-เขียนภายใต้ล็อกเดียวกับการบันทึกอื่นที่เพิ่มยอดตัวนับ
+    with get_counter_lock():
+        # อ่านค่าปัจจุบันของทุกชีทที่เกี่ยวข้องในคำขอเดียว
+        sheets = ["ยอดขาย"] + (["ตู้เย็น"] if qty_by_item else []) + (["iceflow"] if ice_deltas else [])
+        ranges = ["'ยอดขาย'!1:1"] + [gspread.utils.absolute_range_name(t) for t in sheets[1:]]
+        result = spreadsheet.values_batch_get(ranges)
+        values = {
+            sheet_name: pad_values(value_range.get("values", []))
+            for sheet_name, value_range in zip(sheets, result.get("valueRanges", []))
+        }
+
+        header = trim_row(values["ยอดขาย"][0]) if values["ยอดขาย"] else []
+
+        # ส่งใหม่หลังล้มเหลว: batchUpdate ครั้งก่อนอาจสำเร็จไปแล้ว (เช่นขาดการเชื่อมต่อระหว่างรอผล)
+        # ตรวจจากชีทรหัสรายการที่ส่งแล้ว ซึ่งทุกรายการเขียนลงใน batchUpdate เดียวกับการแก้ตัวนับ
+        # รวมทั้งรายการที่ไม่มีแถวยอดขาย เช่นการรับน้ำแข็งเข้า และส่งต่อเฉพาะรายการที่ยังไม่ได้ส่ง
+        if any(entry["attempts"] for entry in entries):
+            # ชีทรหัสรายการถูกตัดแถวเก่าทิ้ง (prune_journal_keys) จึงมีเพียงรายการช่วงที่ยังส่งใหม่ได้
+            sent_keys = {row[0] for row in key_ws.get("A2:A") if row}
+            legacy = [entry for entry in entries if entry["created_at"] < get_sales_journal().key_sheet_since]
+            if legacy and SALE_KEY_COLUMN in header:
+                # รายการที่ส่งครั้งแรกก่อนมีชีทรหัสรายการ บันทึกรหัสไว้เฉพาะในชีทยอดขาย
+                key_letter = gspread.utils.rowcol_to_a1(1, header.index(SALE_KEY_COLUMN) + 1).rstrip("0123456789")
+                sent_keys.update(row[0] for row in summary_ws.get(f"{key_letter}2:{key_letter}") if row)
+            applied = [entry for entry in entries if entry["key"] in sent_keys]
+            if applied:
+                logger.info(f"{len(applied)} journal entries already applied, skipping them")
+                entries = [entry for entry in entries if entry["key"] not in sent_keys]
+                if not entries:
+                    return
+                qty_by_item, ice_deltas = journal_deltas(entries)
+
+        # รหัสรายการในชีทยอดขายช่วยให้ตามแถวยอดขายกลับไปหารายการใน journal ได้
+        # หากยังไม่มีคอลัมน์นี้ เพิ่มต่อจากคอลัมน์สุดท้ายของ header หรือของแถวยอดขายที่กว้างที่สุด
+        requests = []
+        row_width = max((len(row) for entry in entries for row in entry["payload"].get("sale_rows", [])), default=0)
+        if SALE_KEY_COLUMN in header:
+            key_col = header.index(SALE_KEY_COLUMN)
+        else:
+            key_col = max(len(header), row_width)
+            if row_width:
+                requests.append(update_cells_request(summary_ws, 1, key_col + 1, [SALE_KEY_COLUMN]))
+
+        if qty_by_item:
+            requests += stock_update_requests(get_worksheet("ตู้เย็น"), values["ตู้เย็น"], qty_by_item)
+        if ice_deltas:
+            requests += ice_delta_requests(get_worksheet("iceflow"), values["iceflow"], ice_deltas)
+
+        sale_rows = []
+        for entry in entries:
+            for row in entry["payload"].get("sale_rows", []):
+                sale_rows.append((list(row) + [""] * key_col)[:key_col] + [entry["key"]])
+        if sale_rows:
+            requests.append(append_cells_request(summary_ws, sale_rows))
+
+        now = datetime.datetime.now(timezone(TIMEZONE)).strftime("%Y-%m-%d %H:%M:%S")
+        requests.append(append_cells_request(key_ws, [[entry["key"], entry["kind"], now] for entry in entries]))
+
+        commit_sheet_requests(requests)
+        invalidate_sheets(*sheets)
+
+def prefetch_loaders(*loaders):
+    """เรียกฟังก์ชันโหลดข้อมูลที่ไม่ขึ้นต่อกันพร้อมกัน (เติมแคชเดียวกับการเรียกปกติ)"""
+    ctx = get_script_run_ctx()
+
+    def run(loader):
+        # ผูก context ของ session ให้ st.cache_data และ st.error ทำงานในเธรดนี้ได้
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return loader()
+
+    with ThreadPoolExecutor(max_workers=len(loaders)) as pool:
+        return list(pool.map(run, loaders))
+
+class ChartCache:
+    """เก็บภาพกราฟ (PNG) ที่เรนเดอร์แล้ว โดยใช้ hash ของข้อมูลเป็น key และลบภาพที่ไม่ได้ใช้นานที่สุดเมื่อเต็ม"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            png = self._images.get(key)
+            if png is not None:
+                self._images.move_to_end(key)
+            return png
+
+    def put(self, key, png):
+        with self._lock:
+            self._images[key] = png
+            self._images.move_to_end(key)
+            while len(self._images) > self.max_entries:
+                self._images.popitem(last=False)
+
+@st.cache_resource
+def get_chart_cache():
+    """แคชภาพกราฟที่ใช้ร่วมกันทุก session"""
+    return ChartCache(CHART_CACHE_SIZE)
+
+def chart_key(name, *parts):
+    """สร้าง key ของกราฟจากชื่อกราฟและข้อมูลที่ใช้วาด"""
+    digest = hashlib.sha256(name.encode())
+    for part in parts:
+        if isinstance(part, (pd.Series, pd.DataFrame)):
+            digest.update(pd.util.hash_pandas_object(part, index=True).to_numpy().tobytes())
+            digest.update(repr(list(part.columns) if isinstance(part, pd.DataFrame) else part.name).encode())
+        else:
+            digest.update(repr(part).encode())
+    return digest.hexdigest()
+
+def show_chart(key, draw):
+    """แสดงกราฟจากแคช หรือวาดใหม่ด้วย draw(ax) แล้วเก็บภาพไว้ (ปิด figure ทุกครั้งหลังเรนเดอร์)"""
+    cache = get_chart_cache()
+    png = cache.get(key)
+    if png is None:
+        fig, ax = plt.subplots(figsize=(10, 4))
+        try:
+            draw(ax)
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format="png", bbox_inches="tight", dpi=CHART_DPI)
+            png = buffer.getvalue()
+        finally:
+            plt.close(fig)
+        cache.put(key, png)
+    st.image(png, use_container_width=True)
+
 def handle_error(e, context):
     """จัดการและบันทึกข้อผิดพลาด"""
     error_msg = f"เกิดข้อผิดพลาดใน {context}: {str(e)}\n{traceback.format_exc()}"
@@ -645,24 +2401,26 @@ def show_dashboard():
         conn_status.error(f"❌ ข้อผิดพลาดในการเชื่อมต่อ: {str(e)}")
         logger.error(f"Connection error: {e}")
     
-    # โหลดข้อมูล
-    sales_df = load_sales_data()
+    # โหลดข้อมูลทุกชีทที่ใช้ในหน้านี้พร้อมกัน (ยอดขายใช้ยอดรวมที่คำนวณไว้แล้ว)
+    sales_summary, ice, df_products = prefetch_loaders(load_sales_rollups, load_ice_data, load_product_data)
+    df_ice = ice.df
+    rollups = sales_summary["rollups"]
     
     # FIX: ตรวจสอบคอลัมน์ที่จำเป็น
     required_columns = ["วันที่", "ยอดขาย"]
-    if sales_df.empty:
+    if not sales_summary["columns"]:
         st.warning("⚠️ ไม่พบข้อมูลยอดขาย")
     else:
-        missing_cols = [col for col in required_columns if col not in sales_df.columns]
+        missing_cols = [col for col in required_columns if col not in sales_summary["columns"]]
         if missing_cols:
             st.error(f"⚠️ ข้อมูลยอดขายขาดคอลัมน์สำคัญ: {', '.join(missing_cols)}")
             st.info("ℹ️ กรุณาตรวจสอบชีท 'ยอดขาย' ใน Google Sheets ให้มีคอลัมน์: วันที่, ยอดขาย")
             return
     
-    df_ice = load_ice_data()
-    
     # ปุ่มรีเฟรชข้อมูล
     if st.button("🔄 โหลดข้อมูลใหม่", key="refresh_data"):
+        get_sales_ledger().reset()
+        get_sheet_snapshots().mark_stale(*SNAPSHOT_SHEETS)
         st.cache_data.clear()
         st.rerun()
     
@@ -676,22 +2434,26 @@ def show_dashboard():
     st.subheader("📊 สรุปยอดขายรวม")
     col1, col2, col3 = st.columns(3)
     
-    # FIX: ตรวจสอบคอลัมน์ประเภท
-    has_category = "ประเภท" in sales_df.columns
+    # ยอดรวมแยกประเภทจากยอดรวมรายเดือน
+    if rollups:
+        by_category = rollups["month"].groupby(level="ประเภท").sum()
+    else:
+        by_category = pd.DataFrame(columns=SALES_ROLLUP_VALUES, dtype=float)
+    totals = by_category.sum()
     
     # ยอดขายรวม
-    total_sales = sales_df['ยอดขาย'].sum()
+    total_sales = totals.get("ยอดขาย", 0)
     # ยอดขายเครื่องดื่ม (ประเภท 'drink')
-    drinks_sales = sales_df[sales_df['ประเภท'] == 'drink']['ยอดขาย'].sum() if has_category else 0
+    drinks_sales = by_category["ยอดขาย"].get("drink", 0)
     # ยอดขายน้ำแข็ง (ประเภท 'ice')
-    ice_sales = sales_df[sales_df['ประเภท'] == 'ice']['ยอดขาย'].sum() if has_category else total_sales
+    ice_sales = by_category["ยอดขาย"].get("ice", 0)
     
     # ยอดกำไรรวม
-    total_profit = sales_df['กำไร'].sum() if 'กำไร' in sales_df.columns else 0
+    total_profit = totals.get("กำไร", 0)
     # กำไรเครื่องดื่ม
-    drinks_profit = sales_df[sales_df['ประเภท'] == 'drink']['กำไร'].sum() if has_category and 'กำไร' in sales_df.columns else 0
+    drinks_profit = by_category["กำไร"].get("drink", 0)
     # กำไรน้ำแข็ง
-    ice_profit = sales_df[sales_df['ประเภท'] == 'ice']['กำไร'].sum() if has_category and 'กำไร' in sales_df.columns else total_profit
+    ice_profit = by_category["กำไร"].get("ice", 0)
     
     with col1:
         st.metric("💰 ยอดขายรวม", f"{total_sales:,.2f} บาท")
@@ -704,7 +2466,8 @@ def show_dashboard():
                    unsafe_allow_html=True)
     
     with col3:
-        avg_sale = total_sales / len(sales_df) if len(sales_df) > 0 else 0
+        sale_count = totals.get("จำนวนรายการ", 0)
+        avg_sale = total_sales / sale_count if sale_count > 0 else 0
         st.metric("📊 ยอดขายเฉลี่ยต่อรายการ", f"{avg_sale:,.2f} บาท")
     
     # ==============================================
@@ -713,32 +2476,31 @@ def show_dashboard():
     st.subheader("📈 ยอดขายรายวัน")
     
     # FIX: ตรวจสอบคอลัมน์วันที่
-    if "วันที่" in sales_df.columns:
-        # กรองข้อมูลเฉพาะวันนี้
-        today_sales = sales_df.copy()
-        today_sales['วันที่'] = pd.to_datetime(today_sales['วันที่'], errors='coerce')
-        today_sales = today_sales[today_sales['วันที่'].dt.date == today]
-        
-        if not today_sales.empty:
-            # สรุปยอดขายรายชั่วโมง
-            today_sales['ชั่วโมง'] = today_sales['วันที่'].dt.hour
-            hourly_sales = today_sales.groupby('ชั่วโมง')['ยอดขาย'].sum().reset_index()
+    if "วันที่" in sales_summary["columns"]:
+        # ตัดช่วงเฉพาะวันนี้จากยอดรวมรายชั่วโมง (index เรียงตามเวลาแล้ว)
+        hourly = rollups["hour"]["ยอดขาย"].groupby(level="ช่วงเวลา").sum() if rollups else pd.Series(dtype=float)
+        day_start = pd.Timestamp(today)
+        hourly_sales = hourly.loc[day_start:day_start + pd.Timedelta(hours=23)]
+        
+        if not hourly_sales.empty:
+            hours = hourly_sales.index.hour
             
             # สร้างกราฟ
-            fig, ax = plt.subplots(figsize=(10, 4))
-            ax.plot(hourly_sales['ชั่วโมง'], hourly_sales['ยอดขาย'], 
-                    marker='o', color='#007aff', linewidth=2.5)
-            ax.fill_between(hourly_sales['ชั่วโมง'], hourly_sales['ยอดขาย'], 
-                            color='#007aff', alpha=0.1)
+            def draw_hourly(ax):
+                ax.plot(hours, hourly_sales.to_numpy(), 
+                        marker='o', color='#007aff', linewidth=2.5)
+                ax.fill_between(hours, hourly_sales.to_numpy(), 
+                                color='#007aff', alpha=0.1)
+                
+                ax.set_title(f'ยอดขายรายชั่วโมง (วันนี้ {today_str})')
+                ax.set_xlabel('เวลา')
+                ax.set_ylabel('ยอดขาย (บาท)')
+                ax.grid(True, linestyle='--', alpha=0.7)
+                ax.set_xticks(range(0, 24))
+                ax.set_xticklabels([f"{h}:00" for h in range(0, 24)])
+                ax.tick_params(axis='x', labelrotation=45)
             
-            ax.set_title(f'ยอดขายรายชั่วโมง (วันนี้ {today_str})')
-            ax.set_xlabel('เวลา')
-            ax.set_ylabel('ยอดขาย (บาท)')
-            ax.grid(True, linestyle='--', alpha=0.7)
-            ax.set_xticks(range(0, 24))
-            ax.set_xticklabels([f"{h}:00" for h in range(0, 24)])
-            plt.xticks(rotation=45)
-            st.pyplot(fig)
+            show_chart(chart_key("hourly_sales", hourly_sales, today_str), draw_hourly)
         else:
             st.info("ℹ️ ยังไม่มีข้อมูลยอดขายวันนี้")
     else:
@@ -749,35 +2511,31 @@ def show_dashboard():
     # ==============================================
     st.subheader("📅 ยอดขายรายเดือน")
     
-    if not sales_df.empty and "วันที่" in sales_df.columns:
+    if rollups:
         try:
-            # เตรียมข้อมูลรายเดือน
-            sales_df['เดือน'] = sales_df['วันที่'].dt.month
-            sales_df['ปี'] = sales_df['วันที่'].dt.year
-            
-            monthly_sales = sales_df.groupby(['ปี', 'เดือน'])['ยอดขาย'].sum().reset_index()
-            monthly_sales['เดือน-ปี'] = monthly_sales.apply(
-                lambda x: f"{x['เดือน']}/{x['ปี']}", axis=1
-            )
+            # ยอดรวมรายเดือนรวมทุกประเภท
+            monthly_sales = rollups["month"]["ยอดขาย"].groupby(level="ช่วงเวลา").sum()
+            month_labels = [f"{ts.month}/{ts.year}" for ts in monthly_sales.index]
             
             # สร้างกราฟแท่ง
-            fig, ax = plt.subplots(figsize=(10, 4))
-            ax.bar(monthly_sales['เดือน-ปี'], monthly_sales['ยอดขาย'], 
-                  color='#28a745', alpha=0.8)
-            
-            # เพิ่มตัวเลขบนกราฟ
-            for i, v in enumerate(monthly_sales['ยอดขาย']):
-                ax.text(i, v + 0.02*max(monthly_sales['ยอดขาย']), 
-                       f"{v:,.0f}", 
-                       ha='center', 
-                       fontsize=9)
+            def draw_monthly(ax):
+                ax.bar(month_labels, monthly_sales.to_numpy(), 
+                      color='#28a745', alpha=0.8)
+                
+                # เพิ่มตัวเลขบนกราฟ
+                for i, v in enumerate(monthly_sales):
+                    ax.text(i, v + 0.02*monthly_sales.max(), 
+                           f"{v:,.0f}", 
+                           ha='center', 
+                           fontsize=9)
+                
+                ax.set_title('ยอดขายรายเดือน')
+                ax.set_xlabel('เดือน')
+                ax.set_ylabel('ยอดขาย (บาท)')
+                ax.grid(True, linestyle='--', alpha=0.3)
+                ax.tick_params(axis='x', labelrotation=45)
             
-            ax.set_title('ยอดขายรายเดือน')
-            ax.set_xlabel('เดือน')
-            ax.set_ylabel('ยอดขาย (บาท)')
-            ax.grid(True, linestyle='--', alpha=0.3)
-            plt.xticks(rotation=45)
-            st.pyplot(fig)
+            show_chart(chart_key("monthly_sales", monthly_sales), draw_monthly)
         except Exception as e:
             st.error(f"เกิดข้อผิดพลาดในการสร้างกราฟรายเดือน: {str(e)}")
     else:
@@ -793,23 +2551,17 @@ def show_dashboard():
     
     with drink_col:
         st.markdown("### 🥤 เครื่องดื่ม")
-        df_products = load_product_data()
         
         if not df_products.empty:
-            # คำนวณสต็อกคงเหลือ
-            df_products['คงเหลือ'] = df_products.apply(
-                lambda row: safe_int(row['เข้า']) - safe_int(row['ออก']), 
-                axis=1
-            )
-            
-            # แสดง 5 สินค้าที่สต็อกสูงสุด
+            # แสดง 5 สินค้าที่สต็อกสูงสุด (คอลัมน์คงเหลือคำนวณไว้ตอนโหลดข้อมูล)
             top_products = df_products.nlargest(5, 'คงเหลือ')
-            for _, row in top_products.iterrows():
-                stock = safe_int(row['คงเหลือ'])
-                max_stock = safe_int(row['เข้า'])
-                progress = stock / max_stock if max_stock > 0 else 0
-                
-                st.markdown(f"**{row['ชื่อสินค้า']}**")
+            for name, stock, max_stock, progress in zip(
+                top_products['ชื่อสินค้า'],
+                top_products['คงเหลือ'],
+                top_products['เข้า'],
+                top_products['สัดส่วนคงเหลือ']
+            ):
+                st.markdown(f"**{name}**")
                 st.progress(progress)
                 st.caption(f"{stock} / {max_stock} ชิ้น ({progress:.0%})")
         else:
@@ -818,15 +2570,13 @@ def show_dashboard():
     with ice_col:
         st.markdown("### 🧊 น้ำแข็ง")
         if not df_ice.empty:
-            # กรองข้อมูลน้ำแข็งวันนี้
-            ice_today = df_ice[df_ice['วันที่'] == today_str]
-            
             for ice_type in ICE_TYPES:
-                ice_row = ice_today[ice_today["ชนิดน้ำแข็ง"].str.contains(ice_type, na=False)]
-                if not ice_row.empty:
-                    received = safe_float(ice_row.iloc[0]["รับเข้า"])
-                    sold = safe_float(ice_row.iloc[0]["ขายออก"])
-                    melted = safe_float(ice_row.iloc[0]["จำนวนละลาย"])
+                # แสดงเฉพาะข้อมูลน้ำแข็งของวันนี้
+                idx = ice.row(ice_type)
+                if idx is not None and df_ice.at[idx, 'วันที่'] == today_str:
+                    received = safe_float(df_ice.at[idx, "รับเข้า"])
+                    sold = safe_float(df_ice.at[idx, "ขายออก"])
+                    melted = safe_float(df_ice.at[idx, "จำนวนละลาย"])
                     remaining = max(0, received - sold - melted)
                     
                     st.markdown(f"**น้ำแข็ง{ice_type}**")
@@ -842,24 +2592,34 @@ def show_dashboard():
     st.subheader("🏆 สินค้าขายดี")
     
     # แยกสินค้าเครื่องดื่มและน้ำแข็ง
-    if not sales_df.empty:
-        drink_sales = sales_df[sales_df['ประเภท'] == 'drink']
-        ice_sales = sales_df[sales_df['ประเภท'] == 'ice']
+    sale_items = load_sale_items()
+    if not sale_items.empty:
+        drink_items = sale_items[sale_items['category'] == 'drink']
+        ice_items = sale_items[sale_items['category'] == 'ice']
         
         drink_col, ice_col = st.columns(2)
         
         with drink_col:
             st.markdown("### 🥤 เครื่องดื่ม")
-            if not drink_sales.empty and 'รายการ' in drink_sales.columns:
+            if not drink_items.empty:
                 try:
-                    # นับจำนวนครั้งที่ขายแต่ละสินค้า
-                    all_products = []
-                    for items in drink_sales['รายการ']:
-                        products = [item.split(' x ')[0].strip() for item in items.split(',')]
-                        all_products.extend(products)
-                    
-                    top_products = pd.Series(all_products).value_counts().head(5)
+                    # รวมจำนวนชิ้นที่ขายได้ของแต่ละสินค้า
+                    units = drink_items.groupby('product', observed=True)['qty'].sum()
+                    top_products = units.nlargest(5)
                     st.bar_chart(top_products)
+                    
+                    # ยอดขายต่อสินค้า (บิลหลายรายการใช้ราคาขายปัจจุบันจากตู้เย็น)
+                    if not df_products.empty:
+                        catalogue_price = df_products.drop_duplicates('ชื่อสินค้า').set_index('ชื่อสินค้า')['ราคาขาย']
+                        unit_price = drink_items['price'].fillna(drink_items['product'].map(catalogue_price).astype(float))
+                        revenue = (drink_items['qty'] * unit_price).groupby(drink_items['product'], observed=True).sum()
+                        st.dataframe(
+                            pd.DataFrame({
+                                'จำนวนที่ขาย (ชิ้น)': top_products,
+                                'ยอดขาย (บาท)': revenue.reindex(top_products.index)
+                            }),
+                            use_container_width=True
+                        )
                 except Exception as e:
                     st.error(f"เกิดข้อผิดพลาด: {str(e)}")
             else:
@@ -867,16 +2627,10 @@ def show_dashboard():
         
         with ice_col:
             st.markdown("### 🧊 น้ำแข็ง")
-            if not ice_sales.empty and 'รายการ' in ice_sales.columns:
+            if not ice_items.empty:
                 try:
                     # นับจำนวนครั้งที่ขายแต่ละประเภทน้ำแข็ง
-                    ice_types = []
-                    for items in ice_sales['รายการ']:
-                        if 'น้ำแข็ง' in items:
-                            ice_type = items.split('(')[0].replace('น้ำแข็ง', '').strip()
-                            ice_types.append(ice_type)
-                    
-                    top_ice = pd.Series(ice_types).value_counts()
+                    top_ice = ice_items['product'].cat.remove_unused_categories().value_counts()
                     st.bar_chart(top_ice)
                 except Exception as e:
                     st.error(f"เกิดข้อผิดพลาด: {str(e)}")
@@ -922,10 +2676,12 @@ def show_product_sale_page():
     st.subheader("🔍 ค้นหาสินค้า")
     search_term = st.text_input("ค้นหาสินค้า:", key="search_product")
     
+    search_index = product_search_index(df)
+    records = product_records(df)
     if search_term:
-        filtered_products = df[df["ชื่อสินค้า"].str.contains(search_term, case=False)]["ชื่อสินค้า"].tolist()
+        filtered_products = search_index.search(search_term)
     else:
-        filtered_products = df["ชื่อสินค้า"].tolist()
+        filtered_products = search_index.search("", limit=None)
 
     # ส่วนเลือกสินค้า
     if not filtered_products:
@@ -939,11 +2695,11 @@ def show_product_sale_page():
                 st.session_state.quantities[selected_product] = 1
             
             qty = st.session_state.quantities[selected_product]
-            row = df[df["ชื่อสินค้า"] == selected_product]
+            record = records.get(selected_product)
             
-            if not row.empty:
-                stock = safe_int(row["คงเหลือในตู้"].values[0])
-                price = safe_float(row["ราคาขาย"].values[0])
+            if record is not None:
+                stock = record["stock"]
+                price = record["price"]
                 
                 # แสดงข้อมูลสินค้า
                 st.markdown(f"### {selected_product}")
@@ -1009,10 +2765,9 @@ def show_product_sale_page():
         st.info("ℹ️ ยังไม่มีสินค้าในตะกร้า")
     else:
         for idx, (item, qty, price) in enumerate(cart):
-            row = df[df["ชื่อสินค้า"] == item]
-            if not row.empty:
-                row = row.iloc[0]
-                cost = safe_float(row["ต้นทุน"])
+            record = records.get(item)
+            if record is not None:
+                cost = record["cost"]
                 subtotal = qty * price
                 profit = qty * (price - cost)
                 total_price += subtotal
@@ -1095,52 +2850,29 @@ def show_product_sale_page():
                 key="confirm_sale"):
         try:
             with st.spinner("กำลังบันทึกการขาย..."):
-                gc = connect_google_sheets()
-                if not gc:
-                    st.error("❌ ไม่สามารถเชื่อมต่อ Google Sheet ได้")
-                    st.stop()
-                
-                sheet = gc.open_by_key(SHEET_ID)
-                worksheet = sheet.worksheet("ตู้เย็น")
-                summary_ws = sheet.worksheet("ยอดขาย")
-                
-                # อัปเดตสต็อกสินค้า
-                for item, qty, _ in st.session_state.cart:
-                    index = df[df["ชื่อสินค้า"] == item].index[0]
-                    row = df.loc[index]
-                    idx_in_sheet = index + 2  # +2 เพราะ header และ index เริ่มที่ 1
-                    
-                    # คำนวณยอดใหม่
-                    new_out = safe_int(row["ออก"]) + qty
-                    new_left = safe_int(row["คงเหลือในตู้"]) - qty
-                    
-                    # อัปเดตใน Google Sheets
-                    worksheet.update_cell(idx_in_sheet, df.columns.get_loc("ออก") + 1, new_out)
-                    worksheet.update_cell(idx_in_sheet, df.columns.get_loc("คงเหลือในตู้") + 1, new_left)
-                
                 # บันทึกรายการขาย
                 now = datetime.datetime.now(timezone(TIMEZONE)).strftime("%Y-%m-%d %H:%M:%S")
                 items_sold = ", ".join([f"{i} x {q}" for i, q, _ in st.session_state.cart])
-                
-                summary_ws.append_row([
-                    now,                     # วันที่
-                    items_sold,              # รายการ
-                    total_price,             # ยอดขาย
-                    total_profit,            # กำไร
-                    paid_input,              # รับเงิน
-                    paid_input - total_price, # เงินทอน
-                    "drink"                  # ประเภท
-                ])
+
+                # บันทึกลง journal แล้วส่งขึ้น Google Sheets เบื้องหลัง
+                record_sale("drink_sale", {
+                    "items": [[item, int(qty)] for item, qty, _ in st.session_state.cart],
+                    "sale_rows": [[
+                        now,                              # วันที่
+                        items_sold,                       # รายการ
+                        float(total_price),               # ยอดขาย
+                        float(total_profit),              # กำไร
+                        float(paid_input),                # รับเงิน
+                        float(paid_input - total_price),  # เงินทอน
+                        "drink"                           # ประเภท
+                    ]]
+                })
                 
                 # รีเซ็ตข้อมูลหลังขายสำเร็จ
                 clear_cart()
                 
-                # ล้าง cache เพื่อโหลดข้อมูลใหม่
-                st.cache_data.clear()
-                
-                st.success("✅ บันทึกการขายเรียบร้อยแล้ว")
+                st.toast("✅ บันทึกการขายเรียบร้อยแล้ว")
                 logger.info(f"Sale recorded: {total_price} THB, Profit: {total_profit} THB")
-                time.sleep(2)
                 st.rerun()
         except Exception as e:
             st.error(f"เกิดข้อผิดพลาดในการบันทึกการขาย: {str(e)}")
@@ -1149,7 +2881,8 @@ def show_product_sale_page():
 def show_ice_sale_page():
     st.title("🧊 ระบบขายน้ำแข็งเจริญค้า")
     
-    df_ice = load_ice_data()
+    ice = load_ice_data()
+    df_ice = ice.df
     today_str = datetime.datetime.now(timezone(TIMEZONE)).strftime("%-d/%-m/%Y")
     
     # ตรวจสอบคอลัมน์สำคัญ
@@ -1161,19 +2894,6 @@ def show_ice_sale_page():
         st.info("ℹ️ คอลัมน์ที่มีอยู่ในข้อมูล: " + ", ".join(df_ice.columns.tolist()))
         return
 
-    # เก็บยอดเริ่มต้นของทุกค่าที่จำเป็น
-    initial_sales = {}
-    initial_income = {}
-    initial_profit = {}
-    
-    for ice_type in ICE_TYPES:
-        row = df_ice[df_ice["ชนิดน้ำแข็ง"].str.contains(ice_type, na=False)]
-        if not row.empty:
-            idx = row.index[0]
-            initial_sales[ice_type] = safe_float(df_ice.at[idx, "ขายออก"])
-            initial_income[ice_type] = safe_float(df_ice.at[idx, "ยอดขายรวม"])
-            initial_profit[ice_type] = safe_float(df_ice.at[idx, "กำไรสุทธิ"])
-            
     if df_ice.empty:
         st.error("ไม่สามารถโหลดข้อมูลน้ำแข็งได้ กรุณาตรวจสอบการเชื่อมต่อ")
         return
@@ -1199,14 +2919,12 @@ def show_ice_sale_page():
                 if not gc:
                     return
                     
-                sheet = gc.open_by_key(SHEET_ID)
-                iceflow_sheet = sheet.worksheet("iceflow")
+                iceflow_sheet = get_worksheet("iceflow")
                 
                 # รีเซ็ตข้อมูลใน DataFrame
                 for ice_type in ICE_TYPES:
-                    mask = df_ice["ชนิดน้ำแข็ง"].str.contains(ice_type, na=False)
-                    if mask.any():
-                        idx = df_ice[mask].index[0]
+                    idx = ice.row(ice_type)
+                    if idx is not None:
                         df_ice.at[idx, "วันที่"] = today_str
                         df_ice.at[idx, "รับเข้า"] = 0
                         df_ice.at[idx, "ขายออก"] = 0
@@ -1215,8 +2933,11 @@ def show_ice_sale_page():
                         df_ice.at[idx, "ยอดขายรวม"] = 0
                         df_ice.at[idx, "กำไรสุทธิ"] = 0
                 
-                # อัปเดต Google Sheets
-                iceflow_sheet.update([df_ice.columns.tolist()] + df_ice.values.tolist())
+                # อ่านค่าล่าสุดจากชีทภายใต้ล็อกตัวนับ กันการล้างยอดที่ journal เพิ่งเขียนหลังโหลดข้อมูล
+                with get_counter_lock():
+                    requests = ice_reset_requests(iceflow_sheet, pad_values(iceflow_sheet.get()), today_str)
+                    if requests:
+                        commit_sheet_requests(requests)
                 
                 st.success("🔄 ระบบรีเซ็ตยอดใหม่สำหรับวันนี้แล้ว")
                 logger.info("Reset ice data for new day")
@@ -1226,7 +2947,7 @@ def show_ice_sale_page():
                 
                 # รีเซ็ต session state และรีเฟรชหน้า
                 reset_ice_session_state()
-                st.cache_data.clear()
+                invalidate_sheets("iceflow")
                 
                 # แทนที่จะเรียก st.rerun() ทันที ให้แสดงปุ่มให้ผู้ใช้กดรีเฟรชเอง
                 st.warning("โปรดกดปุ่มด้านล่างเพื่อโหลดข้อมูลใหม่")
@@ -1238,14 +2959,16 @@ def show_ice_sale_page():
             st.error(f"เกิดข้อผิดพลาดในการรีเซ็ตข้อมูล: {str(e)}")
             logger.error(f"Error resetting ice data: {e}")
 
+    # เก็บยอดเริ่มต้นไว้คำนวณส่วนต่างตอนบันทึก
+    df_ice_loaded = df_ice.copy()
+
     # ส่วน UI การขายน้ำแข็ง
     st.markdown("### 📥 โซนเติมสต็อกน้ำแข็ง")
     cols = st.columns(4)
     
     for i, ice_type in enumerate(ICE_TYPES):
-        row = df_ice[df_ice["ชนิดน้ำแข็ง"].str.contains(ice_type, na=False)]
-        if not row.empty:
-            idx = row.index[0]
+        idx = ice.row(ice_type)
+        if idx is not None:
             received = safe_float(df_ice.at[idx, "รับเข้า"])  # ใช้ float เพื่อรองรับค่าทศนิยม
             sold = safe_float(df_ice.at[idx, "ขายออก"])
             melted = safe_float(df_ice.at[idx, "จำนวนละลาย"])
@@ -1283,21 +3006,17 @@ def show_ice_sale_page():
     if st.button("📥 บันทึกยอดเติมน้ำแข็ง", type="primary", key="save_restock_ice"):
         try:
             with st.spinner("กำลังบันทึกข้อมูล..."):
-                gc = connect_google_sheets()
-                if not gc:
-                    st.error("❌ ไม่สามารถเชื่อมต่อ Google Sheet ได้")
-                    return
-                    
-                sheet = gc.open_by_key(SHEET_ID)
-                iceflow_sheet = sheet.worksheet("iceflow")
-                iceflow_sheet.update([df_ice.columns.tolist()] + df_ice.values.tolist())
+                # บันทึกเป็นยอดที่เพิ่ม ไม่ใช่ยอดรับเข้ารวม เพื่อไม่ให้ทับยอดจากอุปกรณ์อื่น
+                deltas = ice_counter_deltas(ice, df_ice_loaded, df_ice)
+                if deltas:
+                    record_sale("ice_restock", {"ice_deltas": deltas, "sale_rows": []})
                 
                 # รีเซ็ตเฉพาะฟอร์มเติมสต็อก
                 for ice_type in ICE_TYPES:
                     if f"increase_{ice_type}" in st.session_state:
                         del st.session_state[f"increase_{ice_type}"]
                 
-                st.cache_data.clear()
+                invalidate_sheets("iceflow")
                 st.success("✅ บันทึกยอดเติมน้ำแข็งแล้ว")
                 time.sleep(1)
                 st.rerun()
@@ -1312,9 +3031,8 @@ def show_ice_sale_page():
 
     cols = st.columns(4)
     for i, ice_type in enumerate(ICE_TYPES):
-        row = df_ice[df_ice["ชนิดน้ำแข็ง"].str.contains(ice_type, na=False)]
-        if not row.empty:
-            idx = row.index[0]
+        idx = ice.row(ice_type)
+        if idx is not None:
             # ใช้ initial_sales ที่เก็บไว้ตอนต้น ไม่ต้องเก็บใหม่
             price_per_bag = safe_float(df_ice.at[idx, "ราคาขายต่อหน่วย"])
             cost_per_bag = safe_float(df_ice.at[idx, "ต้นทุนต่อหน่วย"])
@@ -1392,9 +3110,8 @@ def show_ice_sale_page():
     melted_cols = st.columns(4)
     
     for i, ice_type in enumerate(ICE_TYPES):
-        row = df_ice[df_ice["ชนิดน้ำแข็ง"].str.contains(ice_type, na=False)]
-        if not row.empty:
-            idx = row.index[0]
+        idx = ice.row(ice_type)
+        if idx is not None:
             with melted_cols[i]:
                 # ลบ session state ที่มีอยู่เพื่อหลีกเลี่ยงข้อผิดพลาด
                 melted_key = f"melted_{ice_type}"
@@ -1439,9 +3156,8 @@ def show_ice_sale_page():
         
         # ตรวจสอบข้อมูลน้ำแข็งทุกประเภท
         for ice_type in ICE_TYPES:
-            row = df_ice[df_ice["ชนิดน้ำแข็ง"].str.contains(ice_type, na=False)]
-            if not row.empty:
-                idx = row.index[0]
+            idx = ice.row(ice_type)
+            if idx is not None:
                 received = safe_float(df_ice.at[idx, "รับเข้า"])
                 sold = safe_float(df_ice.at[idx, "ขายออก"])
                 melted = safe_float(df_ice.at[idx, "จำนวนละลาย"])
@@ -1467,129 +3183,82 @@ def show_ice_sale_page():
         else:
             try:
                 with st.spinner("กำลังบันทึกการขาย..."):
-                    gc = connect_google_sheets()
-                    if not gc:
-                        st.error("❌ ไม่สามารถเชื่อมต่อ Google Sheet ได้")
-                        return
-                    
-                    sheet = gc.open_by_key(SHEET_ID)
-                    iceflow_sheet = sheet.worksheet("iceflow")
-                    summary_ws = sheet.worksheet("ยอดขาย")
-                    
-                    # บันทึกข้อมูลน้ำแข็ง
-                    iceflow_sheet.update([df_ice.columns.tolist()] + df_ice.values.tolist())
-                    
-                    # บันทึกรายการขายน้ำแข็งลงชีท "ยอดขาย"
+                    # คำนวณส่วนต่างที่เกิดขึ้นในรอบนี้ (ไม่ใช่ยอดสะสม)
+                    deltas = ice_counter_deltas(ice, df_ice_loaded, df_ice)
                     now = datetime.datetime.now(timezone(TIMEZONE)).strftime("%Y-%m-%d %H:%M:%S")
                     
-                    for ice_type in ICE_TYPES:
-                        row = df_ice[df_ice["ชนิดน้ำแข็ง"].str.contains(ice_type, na=False)]
-                        if not row.empty:
-                            idx = row.index[0]
-                            current_sold = safe_float(df_ice.at[idx, "ขายออก"])
-                            
-                            # คำนวณยอดที่ขายในรอบนี้
-                            sold_in_this_session = max(0, current_sold - initial_sales.get(ice_type, 0))
-                            
-                            if sold_in_this_session > 0:
-                                # คำนวณยอดขายและกำไรเฉพาะในรอบนี้
-                                income_in_this_session = df_ice.at[idx, "ยอดขายรวม"] - initial_income.get(ice_type, 0)
-                                profit_in_this_session = df_ice.at[idx, "กำไรสุทธิ"] - initial_profit.get(ice_type, 0)
-                                
-                                # บันทึกลงชีท "ยอดขาย" ด้วยโครงสร้างคอลัมน์ที่ถูกต้อง
-                                summary_ws.append_row([
-                                    now,  # วันที่
-                                    f"น้ำแข็ง{ice_type}",  # รายการ
-                                    float(income_in_this_session),  # ยอดขาย
-                                    float(profit_in_this_session),  # กำไร
-                                    0,  # รับเงิน (สำหรับน้ำแข็งอาจไม่ใช้)
-                                    0,  # เงินทอน (สำหรับน้ำแข็งอาจไม่ใช้)
-                                    "ice"  # ประเภท (ระบุว่าเป็นน้ำแข็ง)
-                                ])
+                    # เตรียมรายการขายน้ำแข็งลงชีท "ยอดขาย"
+                    sale_rows = []
+                    for ice_type, column_deltas in deltas.items():
+                        if column_deltas.get("ขายออก", 0) > 0:
+                            sale_rows.append([
+                                now,  # วันที่
+                                f"น้ำแข็ง{ice_type}",  # รายการ
+                                column_deltas.get("ยอดขายรวม", 0.0),  # ยอดขาย
+                                column_deltas.get("กำไรสุทธิ", 0.0),  # กำไร
+                                0,  # รับเงิน (สำหรับน้ำแข็งอาจไม่ใช้)
+                                0,  # เงินทอน (สำหรับน้ำแข็งอาจไม่ใช้)
+                                "ice"  # ประเภท (ระบุว่าเป็นน้ำแข็ง)
+                            ])
                     
-                    st.cache_data.clear()
-                    st.success("✅ บันทึกการขายน้ำแข็งเรียบร้อย")
-                    time.sleep(1)
+                    # บันทึกลง journal แล้วส่งขึ้น Google Sheets เบื้องหลัง
+                    record_sale("ice_sale", {"ice_deltas": deltas, "sale_rows": sale_rows})
+                    reset_ice_session_state()
+                    st.toast("✅ บันทึกการขายน้ำแข็งเรียบร้อย")
                     st.rerun()
             except Exception as e:
                 st.error(f"เกิดข้อผิดพลาดในการบันทึกข้อมูล: {str(e)}")
                 logger.error(f"Error saving ice sale: {e}")
 
-def save_delivery_data(chain_name: str, data: dict, net_sales: float) -> bool:
-    """บันทึกข้อมูลการส่งน้ำแข็งลง Google Sheets"""
+def get_delivery_worksheet(chain_name):
+    """ชีทของสายส่ง (สร้างพร้อม header หากยังไม่มี)"""
     try:
-        gc = connect_google_sheets()
-        if not gc:
-            return False
-            
-        sheet = gc.open_by_key(SHEET_ID)
-        try:
-            worksheet = sheet.worksheet(chain_name)
-        except gspread.WorksheetNotFound:
-            # สร้างชีทใหม่หากไม่พบ
-            worksheet = sheet.add_worksheet(title=chain_name, rows=100, cols=20)
-            headers = [
-                "วันที่",
-                *[f"น้ำแข็ง{ice_type}_{field}" for ice_type in ICE_TYPES for field in ["ใช้", "เหลือ", "ละลาย"]],
-                "ยอดขายสุทธิ"
-            ]
-            worksheet.append_row(headers)
-        
-        # เตรียมข้อมูลใหม่
-        new_row = {
-            "วันที่": datetime.datetime.now(timezone(TIMEZONE)).strftime("%-d/%-m/%Y")
-        }
-        
-        for ice_type in ICE_TYPES:
-            new_row[f"น้ำแข็ง{ice_type}_ใช้"] = data.get(f"{ice_type}_ใช้", 0)
-            new_row[f"น้ำแข็ง{ice_type}_เหลือ"] = data.get(f"{ice_type}_เหลือ", 0)
-            new_row[f"น้ำแข็ง{ice_type}_ละลาย"] = data.get(f"{ice_type}_ละลาย", 0)
-        
-        new_row["ยอดขายสุทธิ"] = net_sales
-        
-        # แปลงเป็นรายการตามลำดับคอลัมน์
-        headers = worksheet.row_values(1)
-        row_values = [new_row.get(header, "") for header in headers]
-        
-        # บันทึกลงชีท
-        worksheet.append_row(row_values)
-        return True
-        
-    except Exception as e:
-        handle_error(e, f"การบันทึกข้อมูลการส่งน้ำแข็งสำหรับสาย {chain_name}")
-        return False
+        return get_worksheet(chain_name)
+    except gspread.WorksheetNotFound:
+        # สร้างชีทใหม่หากไม่พบ
+        worksheet = add_worksheet(chain_name, rows=100, cols=20)
+        headers = [
+            "วันที่",
+            *[f"น้ำแข็ง{ice_type}_{field}" for ice_type in ICE_TYPES for field in ["ใช้", "เหลือ", "ละลาย"]],
+            "ยอดขายสุทธิ"
+        ]
+        worksheet.append_row(headers)
+        return worksheet
 
-def save_customer_debt_history(customer_name, chain, debt_amount, payment_amount, note=""):
-    """บันทึกประวัติลูกค้าค้างเงิน (ไม่ปรับยอดค้างสะสม)"""
+def delivery_row(headers, data, net_sales):
+    """แถวข้อมูลการส่งน้ำแข็งตามลำดับคอลัมน์ในชีทสายส่ง"""
+    new_row = {
+        "วันที่": datetime.datetime.now(timezone(TIMEZONE)).strftime("%-d/%-m/%Y")
+    }
+    
+    for ice_type in ICE_TYPES:
+        new_row[f"น้ำแข็ง{ice_type}_ใช้"] = data.get(f"{ice_type}_ใช้", 0)
+        new_row[f"น้ำแข็ง{ice_type}_เหลือ"] = data.get(f"{ice_type}_เหลือ", 0)
+        new_row[f"น้ำแข็ง{ice_type}_ละลาย"] = data.get(f"{ice_type}_ละลาย", 0)
+    
+    new_row["ยอดขายสุทธิ"] = net_sales
+    return [new_row.get(header, "") for header in headers]
+
+def get_debt_history_worksheet():
+    """ชีทประวัติลูกค้าค้างเงิน (สร้างพร้อม header หากยังไม่มี)"""
     try:
-        gc = connect_google_sheets()
-        if not gc:
-            return False
-            
-        sheet = gc.open_by_key(SHEET_ID)
-        try:
-            worksheet = sheet.worksheet("ลูกค้าค้างเงิน")
-        except gspread.WorksheetNotFound:
-            worksheet = sheet.add_worksheet(title="ลูกค้าค้างเงิน", rows=100, cols=10)
-            headers = ["วันที่", "ชื่อลูกค้า", "สายส่ง", "ยอดค้าง", "ชำระแล้ว", "หมายเหตุ"]
-            worksheet.append_row(headers)
-        
-        # ข้อมูลใหม่ที่จะบันทึก
-        new_row = [
-            datetime.datetime.now(timezone(TIMEZONE)).strftime("%-d/%-m/%Y"),
-            customer_name,
-            chain,
-            debt_amount,
-            payment_amount,
-            note
-        ]
-        
-        # เพิ่มข้อมูลใหม่ลง Google Sheets
-        worksheet.append_row(new_row)
-        return True
-    except Exception as e:
-        handle_error(e, "การบันทึกประวัติลูกค้าค้างเงิน")
-        return False
+        return get_worksheet("ลูกค้าค้างเงิน")
+    except gspread.WorksheetNotFound:
+        worksheet = add_worksheet("ลูกค้าค้างเงิน", rows=100, cols=10)
+        headers = ["วันที่", "ชื่อลูกค้า", "สายส่ง", "ยอดค้าง", "ชำระแล้ว", "หมายเหตุ"]
+        worksheet.append_row(headers)
+        return worksheet
+
+def debt_history_row(customer_name, chain, debt_amount, payment_amount, note=""):
+    """แถวประวัติลูกค้าค้างเงินตามลำดับคอลัมน์ของชีท"""
+    return [
+        datetime.datetime.now(timezone(TIMEZONE)).strftime("%-d/%-m/%Y"),
+        customer_name,
+        chain,
+        debt_amount,
+        payment_amount,
+        note
+    ]
 
 # Helper functions for Google Sheets operations
 def update_customer_summary(customer_name, new_data):
@@ -1600,26 +3269,29 @@ def update_customer_summary(customer_name, new_data):
             st.error("ไม่สามารถเชื่อมต่อกับ Google Sheets ได้")
             return False
             
-        sheet = gc.open_by_key(SHEET_ID)
-        worksheet = sheet.worksheet("สรุปยอดค้าง")
-        
-        # ค้นหาลูกค้า
-        cell = worksheet.find(customer_name, in_column=1)  # คอลัมน์ 1 คือชื่อลูกค้า
-        row_index = cell.row
-        
-        # เตรียมข้อมูลใหม่
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        row_data = [
-            customer_name,
-            new_data["สายส่ง"],
-            new_data["ยอดค้างสะสม"],
-            new_data["ยอดชำระสะสม"],
-            new_data["ยอดค้างคงเหลือ"],
-            now
-        ]
-        
-        # อัปเดตแถว
-        worksheet.update(f"A{row_index}", [row_data])
+        worksheet = get_worksheet("สรุปยอดค้าง")
+        
+        # อ่านคอลัมน์ชื่อลูกค้า (คอลัมน์ 1) ใหม่ก่อนเขียน ไม่ใช้เลขแถวจากข้อมูลในแคช
+        # เพราะแถวอาจถูกลบหรือเรียงใหม่หลังโหลด ทำให้เขียนทับแถวของลูกค้าคนอื่น
+        with get_counter_lock():
+            row_index = sheet_row_numbers(worksheet.get("A:A"), 0).get(str(customer_name).strip())
+            if row_index is None:
+                st.error(f"ไม่พบลูกค้า {customer_name} ในชีทสรุปยอดค้าง")
+                return False
+            
+            # เตรียมข้อมูลใหม่
+            now = datetime.datetime.now(timezone(TIMEZONE)).strftime("%Y-%m-%d %H:%M:%S")
+            row_data = [
+                customer_name,
+                new_data["สายส่ง"],
+                new_data["ยอดค้างสะสม"],
+                new_data["ยอดชำระสะสม"],
+                new_data["ยอดค้างคงเหลือ"],
+                now
+            ]
+            
+            # อัปเดตแถว
+            worksheet.update(f"A{row_index}", [row_data])
         return True
     except Exception as e:
         handle_error(e, "การอัปเดตข้อมูลลูกค้า")
@@ -1633,11 +3305,10 @@ def add_customer_to_summary(new_customer_data):
             st.error("ไม่สามารถเชื่อมต่อกับ Google Sheets ได้")
             return False
             
-        sheet = gc.open_by_key(SHEET_ID)
-        worksheet = sheet.worksheet("สรุปยอดค้าง")
+        worksheet = get_worksheet("สรุปยอดค้าง")
         
         # เตรียมข้อมูลใหม่
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        now = datetime.datetime.now(timezone(TIMEZONE)).strftime("%Y-%m-%d %H:%M:%S")
         row_data = [
             new_customer_data["ชื่อลูกค้า"],
             new_customer_data["สายส่ง"],
@@ -1654,6 +3325,104 @@ def add_customer_to_summary(new_customer_data):
         handle_error(e, "การเพิ่มลูกค้าใหม่")
         return False
 
+def customer_summary_requests(worksheet, values, changes, now):
+    """คำขอบวกยอดค้าง/ยอดชำระ [(สายส่ง, ชื่อลูกค้า, ยอดค้าง, ยอดชำระ)] เข้ายอดสะสมในชีทสรุปยอดค้าง (ลูกค้าใหม่ต่อท้ายชีท)"""
+    # รวมรายการของลูกค้าคนเดียวกันในรอบเดียวกัน
+    totals = {}
+    for chain, name, debt, payment in changes:
+        name = str(name).strip()
+        _, debt_total, payment_total = totals.get(name, (None, 0.0, 0.0))
+        totals[name] = (str(chain).strip(), debt_total + safe_float(debt), payment_total + safe_float(payment))
+
+    # หาแถวตามชื่อลูกค้าแบบเดียวกับ update_customer_summary (ลูกค้าหนึ่งคนมีแถวเดียว ไม่ว่าจะอยู่สายส่งไหน)
+    headers = values[0] if values else []
+    row_numbers = sheet_row_numbers(values, headers.index("ชื่อลูกค้า")) if "ชื่อลูกค้า" in headers else {}
+    requests = []
+    new_rows = []
+    for name, (chain, debt, payment) in totals.items():
+        row_number = row_numbers.get(name)
+        if row_number is not None:
+            record = dict(zip(headers, values[row_number - 1]))
+            chain = str(record.get("สายส่ง", "")).strip() or chain
+            debt += safe_float(record.get("ยอดค้างสะสม"))
+            payment += safe_float(record.get("ยอดชำระสะสม"))
+        row_data = [name, chain, debt, payment, debt - payment, now]
+        if row_number is None:
+            new_rows.append(row_data)
+        else:
+            requests.append(update_cells_request(worksheet, row_number, 1, row_data))
+    if new_rows:
+        requests.append(append_cells_request(worksheet, new_rows))
+    return requests
+
+def delivery_ice_deltas(data):
+    """ส่วนต่างตัวนับ iceflow จากรอบส่ง (ขายออกเพิ่มตามที่ใช้ลบที่เหลือ และจำนวนละลายเพิ่มตามที่ละลาย)"""
+    deltas = {}
+    for ice_type in ICE_TYPES:
+        column_deltas = {
+            "ขายออก": data.get(f"{ice_type}_ใช้", 0) - data.get(f"{ice_type}_เหลือ", 0),
+            "จำนวนละลาย": data.get(f"{ice_type}_ละลาย", 0),
+        }
+        column_deltas = {col: delta for col, delta in column_deltas.items() if delta != 0}
+        if column_deltas:
+            deltas[ice_type] = column_deltas
+    return deltas
+
+def commit_delivery_round(chain_name, data, net_sales, customer_debts):
+    """บันทึกรอบส่งทั้งหมด (แถวสายส่ง ประวัติค้างเงิน ยอดสะสมลูกค้า และตัวนับ iceflow) ด้วยการอ่านหนึ่งครั้งและ batchUpdate หนึ่งครั้ง"""
+    spreadsheet = get_spreadsheet()
+    if spreadsheet is None:
+        raise ConnectionError("ไม่สามารถเชื่อมต่อ Google Sheet ได้")
+    chain_ws = get_delivery_worksheet(chain_name)
+    ice_deltas = delivery_ice_deltas(data)
+
+    # อ่าน-คำนวณ-เขียนภายใต้ล็อกเดียวกับการบันทึกอื่นที่เพิ่มยอดตัวนับ
+    with get_counter_lock():
+        # อ่านค่าปัจจุบันของทุกชีทที่ต้องใช้ในคำขอเดียว
+        # header ของสายส่งอ่านใหม่ทุกครั้ง เพราะคอลัมน์อาจถูกแก้ในชีทหลังอ่านครั้งก่อน
+        sheets = [chain_name] + (["สรุปยอดค้าง"] if customer_debts else []) + (["iceflow"] if ice_deltas else [])
+        ranges = [gspread.utils.absolute_range_name(chain_name, "1:1")] + [
+            gspread.utils.absolute_range_name(t) for t in sheets[1:]
+        ]
+        result = spreadsheet.values_batch_get(ranges)
+        values = {
+            sheet_name: pad_values(value_range.get("values", []))
+            for sheet_name, value_range in zip(sheets, result.get("valueRanges", []))
+        }
+        header = trim_row(values[chain_name][0]) if values[chain_name] else []
+
+        requests = [append_cells_request(chain_ws, [delivery_row(header, data, net_sales)])]
+        changed = [chain_name]
+
+        if customer_debts:
+            note = f"จากรอบส่งน้ำแข็ง {datetime.datetime.now(timezone(TIMEZONE)).strftime('%d/%m/%Y')}"
+            requests.append(append_cells_request(get_debt_history_worksheet(), [
+                debt_history_row(customer['customer_name'], chain_name, customer['debt_amount'], customer['payment_amount'], note)
+                for customer in customer_debts
+            ]))
+            requests += customer_summary_requests(
+                get_worksheet("สรุปยอดค้าง"),
+                values["สรุปยอดค้าง"],
+                [
+                    (chain_name, customer['customer_name'], customer['debt_amount'], customer['payment_amount'])
+                    for customer in customer_debts
+                ],
+                datetime.datetime.now(timezone(TIMEZONE)).strftime("%Y-%m-%d %H:%M:%S")
+            )
+            changed += ["ลูกค้าค้างเงิน", "สรุปยอดค้าง"]
+
+        # ข้ามน้ำแข็งชนิดที่ไม่มีในชีท iceflow เหมือนเดิม
+        ice_deltas = {
+            ice_type: column_deltas for ice_type, column_deltas in ice_deltas.items()
+            if values.get("iceflow") and find_ice_sheet_row(values["iceflow"], ice_type) is not None
+        }
+        if ice_deltas:
+            requests += ice_delta_requests(get_worksheet("iceflow"), values["iceflow"], ice_deltas)
+            changed.append("iceflow")
+
+        commit_sheet_requests(requests)
+        invalidate_sheets(*changed)
+
 # Main page function
 def show_debt_summary_page():
     st.title("📋 สรุปยอดค้าง")
@@ -1731,7 +3500,7 @@ def show_debt_summary_page():
                 }
                 if update_customer_summary(selected_customer, new_data):
                     st.success("อัปเดตข้อมูลสำเร็จ!")
-                    st.cache_data.clear()  # ล้างแคชข้อมูล
+                    invalidate_sheets("สรุปยอดค้าง")  # ล้างแคชข้อมูล
                     st.rerun()
                 else:
                     st.error("เกิดข้อผิดพลาดในการอัปเดต")
@@ -1771,7 +3540,7 @@ def show_debt_summary_page():
                 }
                 if add_customer_to_summary(new_data):
                     st.success("เพิ่มลูกค้าใหม่สำเร็จ!")
-                    st.cache_data.clear()  # ล้างแคชข้อมูล
+                    invalidate_sheets("สรุปยอดค้าง")  # ล้างแคชข้อมูล
                     st.rerun()
                 else:
                     st.error("เกิดข้อผิดพลาดในการเพิ่มลูกค้า")
@@ -1779,17 +3548,6 @@ def show_debt_summary_page():
 def show_delivery_page():
     st.title("🚚 ระบบจัดการการส่งน้ำแข็ง")
     
-    # กำหนดสายส่งใหม่ตามข้อกำหนด
-    DELIVERY_CHAINS = [
-        "สายพ่วงข้าง",
-        "สายตลาดเช้า",
-        "สายรางม่วง2",
-        "สายหนองแร้ง",
-        "สายดงไผ่",
-        "สายร้านอาหาร",
-        "สายรอบเย็น"
-    ]
-    
     # เลือกสายส่ง
     selected_chain = st.selectbox("เลือกสายส่ง", DELIVERY_CHAINS, key="delivery_chain")
     
@@ -1797,9 +3555,9 @@ def show_delivery_page():
     ice_data = load_ice_data()
     ice_prices = {}
     for ice_type in ICE_TYPES:
-        row = ice_data[ice_data["ชนิดน้ำแข็ง"].str.contains(ice_type, na=False)]
-        if not row.empty:
-            ice_prices[ice_type] = safe_float(row.iloc[0]["ราคาขายต่อหน่วย"])
+        idx = ice_data.row(ice_type)
+        if idx is not None:
+            ice_prices[ice_type] = safe_float(ice_data.df.at[idx, "ราคาขายต่อหน่วย"])
         else:
             ice_prices[ice_type] = 0
             st.warning(f"ไม่พบราคาน้ำแข็ง{ice_type} ในระบบ")
@@ -1838,21 +3596,8 @@ def show_delivery_page():
             )
     
     # โหลดข้อมูลลูกค้าจากสรุปยอดค้าง
-    customer_names = []
-    try:
-        gc = connect_google_sheets()
-        if gc:
-            sheet = gc.open_by_key(SHEET_ID)
-            try:
-                worksheet = sheet.worksheet("สรุปยอดค้าง")
-                records = worksheet.get_all_records()
-                for record in records:
-                    if record["สายส่ง"] == selected_chain:
-                        customer_names.append(record["ชื่อลูกค้า"])
-            except gspread.WorksheetNotFound:
-                pass
-    except Exception as e:
-        st.error(f"เกิดข้อผิดพลาดในการโหลดข้อมูลลูกค้า: {str(e)}")
+    customers = load_customer_directory()
+    customer_names = customers.names(selected_chain)
     
     # ส่วนจัดการลูกค้าค้างเงิน
     st.subheader("🧾 การจัดการลูกค้าค้างเงิน")
@@ -1878,21 +3623,10 @@ def show_delivery_page():
                 new_customer_name = new_customer
                 
                 # แสดงยอดค้างปัจจุบัน
-                if new_customer_name:
-                    try:
-                        gc = connect_google_sheets()
-                        if gc:
-                            sheet = gc.open_by_key(SHEET_ID)
-                            worksheet = sheet.worksheet("สรุปยอดค้าง")
-                            records = worksheet.get_all_records()
-                            for record in records:
-                                if record["ชื่อลูกค้า"] == new_customer_name and record["สายส่ง"] == selected_chain:
-                                    current_debt = safe_float(record["ยอดค้างคงเหลือ"])
-                                    st.markdown(f"<div style='color:red; margin-top:10px;'>ยอดค้างปัจจุบัน: {current_debt:,.2f} บาท</div>", 
-                                                unsafe_allow_html=True)
-                                    break
-                    except Exception:
-                        pass
+                current_debt = customers.balance(selected_chain, new_customer_name)
+                if current_debt is not None:
+                    st.markdown(f"<div style='color:red; margin-top:10px;'>ยอดค้างปัจจุบัน: {current_debt:,.2f} บาท</div>", 
+                                unsafe_allow_html=True)
         
         with col2:
             debt_amount = st.number_input(
@@ -1972,69 +3706,20 @@ def show_delivery_page():
     
     # ปุ่มบันทึกข้อมูล
     if st.button("💾 บันทึกข้อมูล", type="primary", key=f"save_delivery_{selected_chain}"):
-        # บันทึกข้อมูลการส่งน้ำแข็ง
-        if save_delivery_data(selected_chain, delivery_data, net_sales):
-            # บันทึกข้อมูลลูกค้าค้างจ่าย
-            try:
-                for customer in st.session_state.customer_debts:
-                    save_customer_debt_history(
-                        customer_name=customer['customer_name'],
-                        chain=selected_chain,
-                        debt_amount=customer['debt_amount'],
-                        payment_amount=customer['payment_amount'],
-                        note=f"จากรอบส่งน้ำแข็ง {datetime.datetime.now(timezone(TIMEZONE)).strftime('%d/%m/%Y')}"
-                    )
-                    
-                    update_customer_summary(
-                        customer_name=customer['customer_name'],
-                        chain=selected_chain,
-                        debt_amount=customer['debt_amount'],
-                        payment_amount=customer['payment_amount']
-                    )
-                
-                st.success(f"✅ บันทึกข้อมูลการส่งน้ำแข็งและค้างจ่ายเรียบร้อย")
-                
-                # รีเซ็ตข้อมูลลูกค้าสำหรับรอบใหม่
-                st.session_state.customer_debts = []
-                
-                # อัปเดตข้อมูลน้ำแข็งหลัก
-                try:
-                    gc = connect_google_sheets()
-                    if gc:
-                        sheet = gc.open_by_key(SHEET_ID)
-                        iceflow_sheet = sheet.worksheet("iceflow")
-                        df_ice = pd.DataFrame(iceflow_sheet.get_all_records())
-                        
-                        for ice_type in ICE_TYPES:
-                            row = df_ice[df_ice["ชนิดน้ำแข็ง"].str.contains(ice_type, na=False)]
-                            if not row.empty:
-                                idx = row.index[0]
-                                # เพิ่มยอดขายในข้อมูลหลัก
-                                used = delivery_data.get(f"{ice_type}_ใช้", 0)
-                                returned = delivery_data.get(f"{ice_type}_เหลือ", 0)
-                                melted = delivery_data.get(f"{ice_type}_ละลาย", 0)
-                                
-                                # คำนวณยอดขายใหม่
-                                sold_main = safe_float(df_ice.at[idx, "ขายออก"])
-                                df_ice.at[idx, "ขายออก"] = sold_main + (used - returned)
-                                
-                                # เพิ่มน้ำแข็งที่ละลาย
-                                melted_main = safe_float(df_ice.at[idx, "จำนวนละลาย"])
-                                df_ice.at[idx, "จำนวนละลาย"] = melted_main + melted
-                                
-                        # อัปเดต Google Sheets
-                        iceflow_sheet.update([df_ice.columns.tolist()] + df_ice.values.tolist())
-                        st.cache_data.clear()
-                        logger.info(f"อัปเดตข้อมูลน้ำแข็งหลักสำหรับสาย {selected_chain} เรียบร้อย")
-                except Exception as e:
-                    st.error(f"⚠️ ไม่สามารถอัปเดตข้อมูลน้ำแข็งหลักได้: {str(e)}")
-                    logger.error(f"Error updating main ice data: {e}")
-                
-                time.sleep(1)
-                st.rerun()
-            except Exception as e:
-                st.error(f"เกิดข้อผิดพลาดในการบันทึกข้อมูลลูกค้าค้างจ่าย: {str(e)}")
-        else:
+        # บันทึกข้อมูลการส่งน้ำแข็ง ลูกค้าค้างจ่าย และข้อมูลน้ำแข็งหลักในคำขอเดียว
+        try:
+            with st.spinner("กำลังบันทึกข้อมูล..."):
+                commit_delivery_round(selected_chain, delivery_data, net_sales, st.session_state.customer_debts)
+            
+            st.success(f"✅ บันทึกข้อมูลการส่งน้ำแข็งและค้างจ่ายเรียบร้อย")
+            logger.info(f"บันทึกรอบส่งสำหรับสาย {selected_chain} เรียบร้อย")
+            
+            # รีเซ็ตข้อมูลลูกค้าสำหรับรอบใหม่
+            st.session_state.customer_debts = []
+            time.sleep(1)
+            st.rerun()
+        except Exception as e:
+            handle_error(e, f"การบันทึกข้อมูลการส่งน้ำแข็งสำหรับสาย {selected_chain}")
             st.error("❌ ไม่สามารถบันทึกข้อมูลได้ กรุณาลองอีกครั้ง")
     
     # แสดงประวัติการส่ง
@@ -2062,24 +3747,97 @@ def show_delivery_page():
         st.subheader("📈 กราฟยอดขายย้อนหลัง")
         if "ยอดขายสุทธิ" in delivery_history.columns and "วันที่" in delivery_history.columns:
             try:
-                plot_df = delivery_history.copy()
-                plot_df["วันที่"] = pd.to_datetime(plot_df["วันที่"], errors='coerce', dayfirst=True)
-                plot_df = plot_df.dropna(subset=["วันที่"])
+                plot_df = delivery_history.dropna(subset=["วันที่"])
                 plot_df = plot_df.sort_values("วันที่")
                 
-                fig, ax = plt.subplots(figsize=(10, 4))
-                ax.plot(plot_df["วันที่"], plot_df["ยอดขายสุทธิ"], marker='o', color='#007aff')
-                ax.set_title(f'ยอดขายสุทธิสำหรับสาย {selected_chain}')
-                ax.set_xlabel('วันที่')
-                ax.set_ylabel('ยอดขาย (บาท)')
-                ax.grid(True)
-                plt.xticks(rotation=45)
-                st.pyplot(fig)
+                plot_df = plot_df[["วันที่", "ยอดขายสุทธิ"]]
+                
+                def draw_delivery(ax):
+                    ax.plot(plot_df["วันที่"], plot_df["ยอดขายสุทธิ"], marker='o', color='#007aff')
+                    ax.set_title(f'ยอดขายสุทธิสำหรับสาย {selected_chain}')
+                    ax.set_xlabel('วันที่')
+                    ax.set_ylabel('ยอดขาย (บาท)')
+                    ax.grid(True)
+                    ax.tick_params(axis='x', labelrotation=45)
+                
+                show_chart(chart_key("delivery_sales", plot_df, selected_chain), draw_delivery)
             except Exception as e:
                 st.error(f"เกิดข้อผิดพลาดในการสร้างกราฟ: {str(e)}")
     else:
         st.info("ℹ️ ยังไม่มีข้อมูลประวัติการส่งสำหรับสายนี้")
 
+def show_admin_page():
+    st.title("🛠️ สถิติการทำงานของระบบ")
+    metrics = get_app_metrics()
+    data = metrics.snapshot()
+    st.caption(f"เก็บสถิติมาแล้ว {data['uptime_seconds'] / 60:.1f} นาที")
+
+    st.subheader("📡 คำขอ Google Sheets API")
+    if data["sheets_api"]:
+        api = pd.DataFrame(data["sheets_api"])
+        minutes = max(data["uptime_seconds"] / 60, 1)
+        per_sheet = api[api["result"] != "coalesced"].groupby("sheet")["count"].sum().sort_values(ascending=False)
+        st.dataframe(
+            pd.DataFrame({"จำนวนคำขอ": per_sheet, "คำขอ/นาที": (per_sheet / minutes).round(2)}),
+            use_container_width=True
+        )
+        api["เฉลี่ย (ms)"] = (api["seconds"] / api["count"] * 1000).round(1)
+        api["สูงสุด (ms)"] = (api["max_seconds"] * 1000).round(1)
+        st.dataframe(
+            api.sort_values("count", ascending=False)[
+                ["sheet", "operation", "result", "count", "เฉลี่ย (ms)", "สูงสุด (ms)", "rows", "bytes"]
+            ],
+            use_container_width=True, hide_index=True
+        )
+    else:
+        st.info("ยังไม่มีคำขอไปยัง Google Sheets")
+
+    st.subheader("⏱️ เวลาเรนเดอร์แต่ละหน้า")
+    if data["pages"]:
+        pages = pd.DataFrame(data["pages"])
+        pages["เฉลี่ย (ms)"] = (pages["seconds"] / pages["count"] * 1000).round(1)
+        pages["สูงสุด (ms)"] = (pages["max_seconds"] * 1000).round(1)
+        st.dataframe(pages[["page", "result", "count", "เฉลี่ย (ms)", "สูงสุด (ms)"]],
+                     use_container_width=True, hide_index=True)
+
+    st.subheader("🗄️ แคชของฟังก์ชันโหลดข้อมูล")
+    if data["loaders"]:
+        loaders = pd.DataFrame(data["loaders"])
+        loaders["hit rate (%)"] = (loaders["hits"] / loaders["calls"].where(loaders["calls"] > 0) * 100).round(1)
+        st.dataframe(loaders.sort_values("misses", ascending=False), use_container_width=True, hide_index=True)
+
+    with st.expander("คำขอ Sheets API ล่าสุด"):
+        if data["recent_calls"]:
+            recent = pd.DataFrame(data["recent_calls"][::-1])
+            recent["time"] = pd.to_datetime(recent["time"], unit="s", utc=True).dt.tz_convert(TIMEZONE)
+            recent["seconds"] = (recent["seconds"] * 1000).round(1)
+            st.dataframe(recent.rename(columns={"seconds": "ms"}), use_container_width=True, hide_index=True)
+
+    prometheus_text = metrics.to_prometheus()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.download_button("⬇️ JSON", metrics.to_json(), file_name="metrics.json",
+                           mime="application/json", use_container_width=True)
+    with col2:
+        st.download_button("⬇️ Prometheus", prometheus_text, file_name="metrics.prom",
+                           mime="text/plain", use_container_width=True)
+    with col3:
+        if st.button("🔄 เริ่มนับใหม่", use_container_width=True):
+            metrics.reset()
+            st.rerun()
+    with st.expander("Prometheus text"):
+        st.code(prometheus_text, language="text")
+
+def is_admin():
+    """เปิดหน้าผู้ดูแลระบบด้วย ?admin=... (ต้องตั้งค่า ADMIN_KEY และส่งค่าตรงกัน)"""
+    if "admin" not in st.query_params:
+        return False
+    admin_key = get_setting("ADMIN_KEY")
+    if not admin_key:
+        logger.warning("Admin page requested but ADMIN_KEY is not configured")
+        return False
+    return hmac.compare_digest(str(st.query_params["admin"]), str(admin_key))
+
 def main():
     try:
         # ตั้งค่าพื้นฐาน
@@ -2098,6 +3856,15 @@ def main():
             conn_status.error(f"❌ ข้อผิดพลาดในการเชื่อมต่อ: {str(e)}")
             logger.error(f"Connection error in main: {e}")
 
+        # แสดงรายการขายที่ยังรอส่งขึ้น Google Sheets
+        journal = get_sales_journal()
+        pending_sales = journal.pending_count()
+        if pending_sales:
+            st.caption(f"⏳ รอส่งข้อมูลขึ้น Google Sheets {pending_sales} รายการ")
+        failed_sales = journal.failed_count()
+        if failed_sales:
+            st.warning(f"⚠️ มีรายการขาย {failed_sales} รายการที่ส่งขึ้น Google Sheets ไม่สำเร็จ กรุณาติดต่อผู้ดูแลระบบ")
+
         # แสดงเมนูหลัก
         st.markdown("### 🚀 เมนูหลัก")
         col1, col2, col3, col4, col5 = st.columns(5)
@@ -2121,18 +3888,34 @@ def main():
             if st.button("📋 สรุปยอดค้าง", use_container_width=True):
                 st.session_state.page = "สรุปยอดค้าง"
                 st.rerun()
+        admin = is_admin()
+        if admin and st.button("🛠️ สถิติระบบ", use_container_width=True):
+            st.session_state.page = ADMIN_PAGE
+            st.rerun()
 
-        # แสดงหน้าเว็บตามสถานะปัจจุบัน
-        if st.session_state.page == "Dashboard":
-            show_dashboard()
-        elif st.session_state.page == "ขายสินค้า":
-            show_product_sale_page()
-        elif st.session_state.page == "ขายน้ำแข็ง":
-            show_ice_sale_page()
-        elif st.session_state.page == "ส่งน้ำแข็ง":
-            show_delivery_page()
-        elif st.session_state.page == "สรุปยอดค้าง":
-            show_debt_summary_page()
+        # แสดงหน้าเว็บตามสถานะปัจจุบัน (จับเวลาเรนเดอร์ทุกหน้า)
+        page = st.session_state.page
+        result = "interrupted"  # st.rerun/st.stop ออกจากหน้ากลางคัน
+        started = time.perf_counter()
+        try:
+            if page == "Dashboard":
+                show_dashboard()
+            elif page == "ขายสินค้า":
+                show_product_sale_page()
+            elif page == "ขายน้ำแข็ง":
+                show_ice_sale_page()
+            elif page == "ส่งน้ำแข็ง":
+                show_delivery_page()
+            elif page == "สรุปยอดค้าง":
+                show_debt_summary_page()
+            elif page == ADMIN_PAGE and admin:
+                show_admin_page()
+            result = "ok"
+        except Exception:
+            result = "error"
+            raise
+        finally:
+            get_app_metrics().record_page(page, time.perf_counter() - started, result)
             
     except Exception as page_error:
         logger.error(f"Page error in {st.session_state.page}: {str(page_error)}", exc_info=True)
@@ -2164,6 +3947,7 @@ def main():
         col1, col2 = st.columns(2)
         with col1:
             if st.button("🔄 รีเฟรชหน้า", help="ลองรีเฟรชหน้าเว็บหากเกิดข้อผิดพลาด"):
+                get_sheet_snapshots().mark_stale(*SNAPSHOT_SHEETS)
                 st.cache_data.clear()
                 st.rerun()
         with col2:
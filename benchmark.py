@@ -0,0 +1,663 @@
+"""วัดประสิทธิภาพ app.py แบบออฟไลน์ด้วย Google Sheets จำลองในหน่วยความจำ
+
+ตัวจำลองทำงานที่ระดับ HTTP session ของ gspread ทำให้ Client/Spreadsheet/Worksheet ของ gspread
+และ SheetsGateway (จำกัดอัตรา ลองใหม่ รวมคำขอ) ของแอปทำงานจริงทั้งหมด
+แต่ละ scenario รันในโปรเซสแยกเพื่อให้แคชและเธรดเบื้องหลังเริ่มจากศูนย์ทุกครั้ง
+
+ตัวอย่าง:
+    python benchmark.py                                   # ขนาดข้อมูลเต็ม (ยอดขาย 1 ล้านแถว)
+    python benchmark.py --sales-rows 50000 --json out.json
+    python benchmark.py --latency 0.2 --error-rate 0.05   # จำลองเครือข่ายช้าและโดน 429
+    python benchmark.py --compare baseline.json           # exit 1 เมื่อช้าลงหรือเรียก API มากขึ้น
+"""
+
+# Standard library imports
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.parse
+import warnings
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+# Third-party imports
+import gspread
+from gspread.utils import a1_range_to_grid_range, rowcol_to_a1
+
+PRODUCT_BRANDS = [
+    "โค้ก", "เป๊ปซี่", "แฟนต้า", "สไปรท์", "น้ำดื่มสิงห์", "น้ำดื่มคริสตัล", "ชาเขียวโออิชิ", "ชาเขียวอิชิตัน",
+    "เบียร์ช้าง", "เบียร์ลีโอ", "เบียร์สิงห์", "กาแฟเบอร์ดี้", "นมไทยเดนมาร์ก", "โซดาสิงห์", "เอ็ม150",
+    "กระทิงแดง", "คาราบาวแดง", "สปอนเซอร์", "เกเตอเรด", "ยาคูลท์",
+]
+PRODUCT_SIZES = ["กระป๋อง", "ขวดเล็ก", "ขวดกลาง", "ขวดใหญ่", "1.5 ลิตร", "แพ็ค 6"]
+
+def format_number(value):
+    """แสดงตัวเลขแบบที่ Sheets ส่งกลับ (จำนวนเต็มไม่มีทศนิยม)"""
+    value = float(value)
+    if value.is_integer():
+        return str(int(value))
+    return ("%.10f" % value).rstrip("0").rstrip(".")
+
+def cell_text(value):
+    """ค่าที่ส่งเข้า values API เป็นข้อความที่ Sheets แสดงผล"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float)):
+        return format_number(value)
+    return str(value)
+
+def cell_data_text(cell):
+    """ค่าใน CellData ของคำขอ batchUpdate เป็นข้อความที่ Sheets แสดงผล"""
+    value = cell.get("userEnteredValue", {})
+    if "numberValue" in value:
+        return format_number(value["numberValue"])
+    if "boolValue" in value:
+        return "TRUE" if value["boolValue"] else "FALSE"
+    return str(value.get("stringValue", value.get("formulaValue", "")))
+
+class FakeSheet:
+    """ข้อมูลของชีทจำลอง แถวต้นชีทสร้างตอนอ่านจาก generator ได้ (ไม่ต้องเก็บแถวนับล้านไว้ในหน่วยความจำ)"""
+
+    def __init__(self, sheet_id, title, rows=(), generated=0, generator=None):
+        self.id = sheet_id
+        self.title = title
+        self.generated = generated
+        self.generator = generator
+        self.edits = {}  # แถวจาก generator ที่ถูกแก้ไข
+        self.rows = [list(row) for row in rows]
+
+    def __len__(self):
+        return self.generated + len(self.rows)
+
+    def row(self, i):
+        if i < self.generated:
+            row = self.edits.get(i)
+            return row if row is not None else self.generator(i)
+        return self.rows[i - self.generated]
+
+    def width(self):
+        return len(self.row(0)) if len(self) else 0
+
+    def set_row(self, i, col, values):
+        """เขียนค่าต่อเนื่องกันในแถว i เริ่มที่คอลัมน์ col (index เริ่มที่ 0)"""
+        if i < self.generated:
+            row = self.edits.setdefault(i, list(self.generator(i)))
+        else:
+            while len(self) <= i:
+                self.rows.append([])
+            row = self.rows[i - self.generated]
+        if len(row) < col + len(values):
+            row.extend([""] * (col + len(values) - len(row)))
+        row[col:col + len(values)] = values
+
+    def append(self, rows):
+        start = len(self)
+        self.rows.extend(list(row) for row in rows)
+        return start
+
+    def properties(self, index):
+        return {
+            "sheetId": self.id,
+            "title": self.title,
+            "index": index,
+            "sheetType": "GRID",
+            "gridProperties": {"rowCount": max(1000, len(self) + 100), "columnCount": max(26, self.width())},
+        }
+
+class FakeResponse:
+    """คำตอบ HTTP ที่มีหน้าตาเหมือน requests.Response เท่าที่ gspread ใช้"""
+
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.content = json.dumps(payload, ensure_ascii=False).encode()
+        self.headers = {"Content-Type": "application/json; charset=UTF-8"}
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode()
+
+    def json(self):
+        return json.loads(self.content)
+
+class FakeSheetsSession:
+    """HTTP session จำลองของ Google Sheets API v4 (เฉพาะ endpoint ที่ gspread ใช้ในแอปนี้)"""
+
+    def __init__(self, spreadsheet_id, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        self.spreadsheet_id = spreadsheet_id
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.sheets = {}
+        self.calls = Counter()        # ชนิดคำขอ -> จำนวนครั้ง
+        self.quota_errors = 0
+        self.rows_written = 0
+        self._next_id = 1000
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.headers = {}
+
+    def add_sheet(self, title, rows=(), generated=0, generator=None):
+        with self._lock:
+            self._next_id += 1
+            self.sheets[title] = FakeSheet(self._next_id, title, rows, generated, generator)
+            return self.sheets[title]
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls.clear()
+            self.quota_errors = 0
+            self.rows_written = 0
+
+    def request(self, method, url, json=None, params=None, data=None, files=None, headers=None, timeout=None, **kwargs):
+        method = method.upper()
+        path = urllib.parse.urlparse(url).path
+        match = re.match(rf".*/spreadsheets/{re.escape(self.spreadsheet_id)}(.*)$", path)
+        if not match:
+            return self._error(404, f"Unknown endpoint {path}", "NOT_FOUND")
+        rest = match.group(1)
+        params = params or {}
+        body = json or {}
+
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            quota_error = self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+
+        with self._lock:
+            if rest == "":
+                operation, handler = "metadata", self._metadata
+            elif rest == ":batchUpdate":
+                operation, handler = "batchUpdate", lambda: self._batch_update(body)
+            elif rest == "/values:batchGet":
+                ranges = params.get("ranges", [])
+                ranges = [ranges] if isinstance(ranges, str) else ranges
+                operation, handler = "values.batchGet", lambda: self._batch_get(ranges)
+            elif rest == "/values:batchUpdate":
+                operation, handler = "values.batchUpdate", lambda: self._values_batch_update(body)
+            elif rest.startswith("/values/"):
+                a1_range, _, action = rest[len("/values/"):].partition(":")
+                a1_range = urllib.parse.unquote(a1_range)
+                if action == "append":
+                    operation, handler = "values.append", lambda: self._append(a1_range, body)
+                elif action == "clear":
+                    operation, handler = "values.clear", lambda: self._clear(a1_range)
+                elif method == "GET":
+                    operation, handler = "values.get", lambda: self._get(a1_range)
+                else:
+                    operation, handler = "values.update", lambda: self._update(a1_range, body)
+            else:
+                return self._error(404, f"Unsupported endpoint {rest}", "NOT_FOUND")
+
+            self.calls[operation] += 1
+            if quota_error:
+                self.quota_errors += 1
+                return self._error(429, "Quota exceeded for quota metric 'Read requests'", "RESOURCE_EXHAUSTED")
+            try:
+                payload = handler()
+            except KeyError as e:
+                return self._error(400, f"Unable to parse range: {e}", "INVALID_ARGUMENT")
+            except ValueError as e:
+                return self._error(400, str(e), "INVALID_ARGUMENT")
+        # แปลงเป็น JSON นอกล็อก ให้คำขอพร้อมกันไม่ต้องรอกัน
+        return FakeResponse(200, payload)
+
+    def _error(self, code, message, status):
+        return FakeResponse(code, {"error": {"code": code, "message": message, "status": status}})
+
+    def _metadata(self):
+        return {
+            "spreadsheetId": self.spreadsheet_id,
+            "properties": {"title": "เจริญค้า (benchmark)", "locale": "th_TH", "timeZone": "Asia/Bangkok"},
+            "sheets": [{"properties": sheet.properties(i)} for i, sheet in enumerate(self.sheets.values())],
+        }
+
+    def _resolve(self, a1_range):
+        """แยกชื่อชีทและช่วงแถว/คอลัมน์ (index เริ่มที่ 0 แบบครึ่งเปิด) จาก A1 notation"""
+        title, _, cells = a1_range.rpartition("!") if "!" in a1_range else (a1_range, "", "")
+        if len(title) >= 2 and title[0] == title[-1] == "'":
+            title = title[1:-1].replace("''", "'")
+        sheet = self.sheets[title]
+        grid = a1_range_to_grid_range(cells) if cells else {}
+        return (
+            sheet,
+            grid.get("startRowIndex", 0), grid.get("endRowIndex", len(sheet)),
+            grid.get("startColumnIndex", 0), grid.get("endColumnIndex"),
+        )
+
+    def _get(self, a1_range):
+        # ใช้ trim_row ตัวเดียวกับแอป (import หลัง run_scenario ตั้งค่า environment แล้ว)
+        from app import trim_row
+
+        sheet, row0, row1, col0, col1 = self._resolve(a1_range)
+        values = [trim_row(sheet.row(i)[col0:col1]) for i in range(row0, min(row1, len(sheet)))]
+        while values and not values[-1]:
+            values.pop()
+        result = {"range": a1_range, "majorDimension": "ROWS"}
+        if values:
+            result["values"] = values
+        return result
+
+    def _batch_get(self, ranges):
+        return {"spreadsheetId": self.spreadsheet_id, "valueRanges": [self._get(r) for r in ranges]}
+
+    def _update(self, a1_range, body):
+        sheet, row0, _, col0, _ = self._resolve(a1_range)
+        values = body.get("values", [])
+        for offset, row in enumerate(values):
+            sheet.set_row(row0 + offset, col0, [cell_text(v) for v in row])
+        self.rows_written += len(values)
+        return {"spreadsheetId": self.spreadsheet_id, "updatedRange": a1_range, "updatedRows": len(values)}
+
+    def _values_batch_update(self, body):
+        responses = [self._update(item["range"], item) for item in body.get("data", [])]
+        return {"spreadsheetId": self.spreadsheet_id, "responses": responses}
+
+    def _append(self, a1_range, body):
+        sheet = self._resolve(a1_range)[0]
+        values = body.get("values", [])
+        start = sheet.append([cell_text(v) for v in row] for row in values)
+        self.rows_written += len(values)
+        updated = f"'{sheet.title}'!A{start + 1}:{rowcol_to_a1(start + max(len(values), 1), max(1, max(map(len, values), default=1)))}"
+        return {"spreadsheetId": self.spreadsheet_id, "updates": {"updatedRange": updated, "updatedRows": len(values)}}
+
+    def _clear(self, a1_range):
+        sheet, row0, row1, col0, col1 = self._resolve(a1_range)
+        for i in range(row0, min(row1, len(sheet))):
+            row = sheet.row(i)
+            end = len(row) if col1 is None else min(col1, len(row))
+            if end > col0:
+                sheet.set_row(i, col0, [""] * (end - col0))
+        return {"spreadsheetId": self.spreadsheet_id, "clearedRange": a1_range}
+
+    def _batch_update(self, body):
+        sheets = {sheet.id: sheet for sheet in self.sheets.values()}
+
+        def by_id(sheet_id):
+            if sheet_id not in sheets:
+                # ข้อความเดียวกับ Sheets API เมื่อ sheetId ไม่มีแล้ว
+                raise ValueError(f"Invalid requests[{index}].{kind}: No grid with id: {sheet_id}")
+            return sheets[sheet_id]
+
+        replies = []
+        for index, request in enumerate(body.get("requests", [])):
+            kind = next(iter(request), "")
+            if "updateCells" in request:
+                spec = request["updateCells"]
+                start = spec.get("start") or {
+                    "sheetId": spec["range"]["sheetId"],
+                    "rowIndex": spec["range"].get("startRowIndex", 0),
+                    "columnIndex": spec["range"].get("startColumnIndex", 0),
+                }
+                sheet = by_id(start["sheetId"])
+                for offset, row in enumerate(spec.get("rows", [])):
+                    sheet.set_row(start["rowIndex"] + offset, start["columnIndex"],
+                                  [cell_data_text(cell) for cell in row.get("values", [])])
+                self.rows_written += len(spec.get("rows", []))
+                replies.append({})
+            elif "appendCells" in request:
+                spec = request["appendCells"]
+                rows = spec.get("rows", [])
+                by_id(spec["sheetId"]).append([cell_data_text(cell) for cell in row.get("values", [])] for row in rows)
+                self.rows_written += len(rows)
+                replies.append({})
+            elif "deleteDimension" in request:
+                spec = request["deleteDimension"]["range"]
+                sheet = by_id(spec["sheetId"])
+                if spec["dimension"] != "ROWS" or spec["startIndex"] < sheet.generated:
+                    raise ValueError(f"Invalid requests[{index}].{kind}: unsupported by the fake")
+                del sheet.rows[spec["startIndex"] - sheet.generated:spec["endIndex"] - sheet.generated]
+                replies.append({})
+            elif "addSheet" in request:
+                title = request["addSheet"]["properties"]["title"]
+                self._next_id += 1
+                sheet = self.sheets[title] = FakeSheet(self._next_id, title)
+                replies.append({"addSheet": {"properties": sheet.properties(len(self.sheets) - 1)}})
+            else:
+                replies.append({})
+        return {"spreadsheetId": self.spreadsheet_id, "replies": replies}
+
+def product_name(i):
+    return f"{PRODUCT_BRANDS[i % len(PRODUCT_BRANDS)]} {PRODUCT_SIZES[(i // len(PRODUCT_BRANDS)) % len(PRODUCT_SIZES)]} #{i + 1}"
+
+def build_fixture(session, app, options):
+    """สร้างชีทตัวอย่างตามขนาดที่กำหนด (สินค้า ยอดขาย ลูกค้าค้าง และสายส่ง)"""
+    rng = random.Random(options.seed)
+    tz = app.timezone(app.TIMEZONE)
+    now = datetime.datetime.now(tz).replace(tzinfo=None)
+    today_str = now.strftime("%-d/%-m/%Y")
+
+    products = []
+    for i in range(options.products):
+        price = rng.choice([10, 12, 15, 20, 25, 35, 45, 60])
+        received = rng.randint(0, 200)
+        sold = rng.randint(0, received)
+        products.append([product_name(i), price, round(price * 0.7, 2), received, sold, received - sold])
+    session.add_sheet("ตู้เย็น", [["ชื่อสินค้า", "ราคาขาย", "ต้นทุน", "เข้า", "ออก", "คงเหลือในตู้"]] +
+                      [[cell_text(v) for v in row] for row in products])
+
+    # ยอดขายกระจายตลอด 365 วันจนถึงตอนนี้ แถวสร้างตอนอ่าน
+    sales_header = ["วันที่", "รายการ", "ยอดขาย", "กำไร", "รับเงิน", "เงินทอน", "ประเภท", app.SALE_KEY_COLUMN]
+    total = options.sales_rows
+    start = now - datetime.timedelta(days=365)
+    step = 365 * 86400 / max(total, 1)
+    ice_names = [f"น้ำแข็ง{ice_type}" for ice_type in app.ICE_TYPES]
+    product_count = max(options.products, 1)
+
+    def sales_row(i):
+        if i == 0:
+            return sales_header
+        timestamp = (start + datetime.timedelta(seconds=int(i * step))).strftime("%Y-%m-%d %H:%M:%S")
+        if i % 5 == 0:
+            amount = 40 * (1 + i % 4)
+            return [timestamp, ice_names[i % 4], str(amount), str(amount // 4), "0", "0", "ice", f"bench-{i}"]
+        first, second = (i * 7919) % product_count, (i * 104729) % product_count
+        qty = 1 + i % 3
+        items = f"{product_name(first)} x {qty}" if i % 3 else f"{product_name(first)} x {qty}, {product_name(second)} x 1"
+        amount = 15 * (qty + (0 if i % 3 else 1))
+        paid = (amount // 20 + 1) * 20
+        return [timestamp, items, str(amount), format_number(amount * 0.3), str(paid), str(paid - amount), "drink", f"bench-{i}"]
+
+    session.add_sheet("ยอดขาย", generated=total + 1, generator=sales_row)
+
+    ice_header = ["ชนิดน้ำแข็ง", "ราคาขายต่อหน่วย", "ต้นทุนต่อหน่วย", "รับเข้า", "ขายออก", "จำนวนละลาย",
+                  "คงเหลือตอนเย็น", "ยอดขายรวม", "กำไรสุทธิ", "วันที่"]
+    ice_rows = [[ice_type, "40", "28", "200", "120", "5", "75", "4800", "1440", today_str] for ice_type in app.ICE_TYPES]
+    session.add_sheet("iceflow", [ice_header] + ice_rows)
+
+    chains = app.DELIVERY_CHAINS[:options.chains]
+    summary = [["ชื่อลูกค้า", "สายส่ง", "ยอดค้างสะสม", "ยอดชำระสะสม", "ยอดค้างคงเหลือ", "อัปเดตล่าสุด"]]
+    history = [["วันที่", "ชื่อลูกค้า", "สายส่ง", "ยอดค้าง", "ชำระแล้ว", "หมายเหตุ"]]
+    for i in range(options.debtors):
+        name, chain = f"ลูกค้า{i + 1:04d}", chains[i % len(chains)]
+        debt = rng.randint(100, 5000)
+        paid = rng.randint(0, debt)
+        summary.append([name, chain, str(debt), str(paid), str(debt - paid), now.strftime("%Y-%m-%d %H:%M:%S")])
+        for day in range(5):
+            history.append([(now - datetime.timedelta(days=day * 7)).strftime("%-d/%-m/%Y"), name, chain,
+                            str(debt // 5), str(paid // 5), ""])
+    session.add_sheet("สรุปยอดค้าง", summary)
+    session.add_sheet("ลูกค้าค้างเงิน", history)
+
+    chain_header = ["วันที่", *[f"น้ำแข็ง{t}_{f}" for t in app.ICE_TYPES for f in ["ใช้", "เหลือ", "ละลาย"]], "ยอดขายสุทธิ"]
+    for chain in chains:
+        rows = [chain_header]
+        for day in range(365, 0, -1):
+            used = [rng.randint(20, 60) for _ in app.ICE_TYPES]
+            cells = []
+            for amount in used:
+                cells += [str(amount), str(rng.randint(0, 5)), str(rng.randint(0, 2))]
+            rows.append([(now - datetime.timedelta(days=day)).strftime("%-d/%-m/%Y"), *cells, str(sum(used) * 35)])
+        session.add_sheet(chain, rows)
+
+# ==============================================
+# scenarios: setup (ไม่จับเวลา) แล้ว run (จับเวลา นับคำขอ และวัดหน่วยความจำ)
+# ==============================================
+
+def call_all_loaders(app, options):
+    app.load_product_data()
+    app.load_customer_debt_data()
+    app.load_customer_summary()
+    app.load_customer_directory()
+    app.load_sales_data()
+    app.load_sale_items()
+    app.load_sales_rollups()
+    app.load_ice_data()
+    for chain in app.DELIVERY_CHAINS[:options.chains]:
+        app.load_delivery_data(chain)
+
+def wait_for_journal(app, timeout=120):
+    """รอจนเธรดเบื้องหลังส่งรายการใน journal ขึ้นชีทหมด"""
+    journal = app.get_sales_journal()
+    deadline = time.monotonic() + timeout
+    while journal.pending_count():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"journal ยังค้าง {journal.pending_count()} รายการ")
+        time.sleep(0.005)
+    if journal.failed_count():
+        raise RuntimeError(f"journal ส่งไม่สำเร็จ {journal.failed_count()} รายการ")
+
+def setup_nothing(app, options):
+    pass
+
+def run_loaders(app, options):
+    call_all_loaders(app, options)
+
+def run_drink_checkout(app, options):
+    # เหมือนปุ่มยืนยันการขายในหน้าขายสินค้า: โหลดสินค้า บันทึกลง journal แล้วรอส่งขึ้นชีท
+    rng = random.Random(options.seed)
+    for _ in range(options.iterations):
+        products = app.load_product_data()
+        cart = products.sample(rng.randint(1, 3), random_state=rng.randint(0, 2 ** 31))
+        items = [[name, rng.randint(1, 3)] for name in cart["ชื่อสินค้า"]]
+        total = sum(qty * price for (_, qty), price in zip(items, cart["ราคาขาย"]))
+        profit = sum(qty * (price - cost) for (_, qty), price, cost in zip(items, cart["ราคาขาย"], cart["ต้นทุน"]))
+        now = datetime.datetime.now(app.timezone(app.TIMEZONE)).strftime("%Y-%m-%d %H:%M:%S")
+        app.record_sale("drink_sale", {
+            "items": items,
+            "sale_rows": [[now, ", ".join(f"{i} x {q}" for i, q in items), float(total), float(profit),
+                           float(total), 0.0, "drink"]],
+        })
+        wait_for_journal(app)
+
+def run_ice_restock(app, options):
+    # เหมือนปุ่มบันทึกยอดเติมน้ำแข็ง
+    for _ in range(options.iterations):
+        ice = app.load_ice_data()
+        before = ice.df.copy()
+        for ice_type in app.ICE_TYPES:
+            ice.df.at[ice.row(ice_type), "รับเข้า"] += 10
+        deltas = app.ice_counter_deltas(ice, before, ice.df)
+        app.record_sale("ice_restock", {"ice_deltas": deltas, "sale_rows": []})
+        app.invalidate_sheets("iceflow")
+        wait_for_journal(app)
+
+def run_ice_sale(app, options):
+    # เหมือนปุ่มบันทึกการขายน้ำแข็ง
+    for _ in range(options.iterations):
+        ice = app.load_ice_data()
+        before = ice.df.copy()
+        for ice_type in app.ICE_TYPES:
+            idx = ice.row(ice_type)
+            price = float(ice.df.at[idx, "ราคาขายต่อหน่วย"])
+            cost = float(ice.df.at[idx, "ต้นทุนต่อหน่วย"])
+            ice.df.at[idx, "ขายออก"] += 2
+            ice.df.at[idx, "ยอดขายรวม"] += 2 * price
+            ice.df.at[idx, "กำไรสุทธิ"] += 2 * (price - cost)
+        deltas = app.ice_counter_deltas(ice, before, ice.df)
+        now = datetime.datetime.now(app.timezone(app.TIMEZONE)).strftime("%Y-%m-%d %H:%M:%S")
+        sale_rows = [
+            [now, f"น้ำแข็ง{ice_type}", d.get("ยอดขายรวม", 0.0), d.get("กำไรสุทธิ", 0.0), 0, 0, "ice"]
+            for ice_type, d in deltas.items()
+        ]
+        app.record_sale("ice_sale", {"ice_deltas": deltas, "sale_rows": sale_rows})
+        wait_for_journal(app)
+
+def run_delivery_closeout(app, options):
+    # เหมือนปุ่มบันทึกในหน้าส่งน้ำแข็ง: ปิดรอบทุกสาย พร้อมลูกค้าค้าง/ชำระสายละ 5 ราย
+    customers = app.load_customer_directory()
+    for chain in app.DELIVERY_CHAINS[:options.chains]:
+        data = {}
+        for ice_type in app.ICE_TYPES:
+            data.update({f"{ice_type}_ใช้": 40, f"{ice_type}_เหลือ": 3, f"{ice_type}_ละลาย": 1})
+        debts = [
+            {"customer_name": name, "debt_amount": 120.0, "payment_amount": 50.0}
+            for name in customers.names(chain)[:5]
+        ]
+        app.commit_delivery_round(chain, data, 36 * 40 * len(app.ICE_TYPES), debts)
+
+def run_dashboard(app, options):
+    app.show_dashboard()
+
+def setup_loaders(app, options):
+    call_all_loaders(app, options)
+
+def setup_products(app, options):
+    app.load_product_data()
+    app.get_sales_journal()
+
+def setup_ice(app, options):
+    app.load_ice_data()
+    app.get_sales_journal()
+
+def setup_delivery(app, options):
+    app.load_customer_directory()
+    app.load_ice_data()
+
+def setup_dashboard(app, options):
+    app.show_dashboard()
+
+SCENARIOS = {
+    "loaders_cold": (setup_nothing, run_loaders),
+    "loaders_warm": (setup_loaders, run_loaders),
+    "drink_checkout": (setup_products, run_drink_checkout),
+    "ice_restock": (setup_ice, run_ice_restock),
+    "ice_sale": (setup_ice, run_ice_sale),
+    "delivery_closeout": (setup_delivery, run_delivery_closeout),
+    "dashboard_cold": (setup_nothing, run_dashboard),
+    "dashboard_warm": (setup_dashboard, run_dashboard),
+}
+
+def run_scenario(name, options, trace_memory=False):
+    """รัน scenario หนึ่งตัวในโปรเซสนี้ (เรียกผ่าน ProcessPoolExecutor) แล้วคืนผลเป็น dict"""
+    # ลบไฟล์ journal และสำเนา local เมื่อจบ scenario (เธรดเบื้องหลังอาจยังเปิดไฟล์อยู่)
+    with tempfile.TemporaryDirectory(prefix="jaroenka-bench-", ignore_cleanup_errors=True) as workdir:
+        os.environ["SALES_JOURNAL_PATH"] = os.path.join(workdir, "sales_journal.db")
+        os.environ["SHEETS_REQUESTS_PER_MINUTE"] = str(options.requests_per_minute)
+        os.environ.pop("LOCAL_MIRROR_PATH", None)
+
+        # Streamlit เตือนทุกครั้งที่เรียก st.* นอก streamlit run (โหลด config ก่อน ไม่ให้ตั้งระดับ log กลับ)
+        import streamlit.config
+        import streamlit.logger
+        streamlit.config.get_config_options()
+        streamlit.logger.set_log_level("error")
+
+        import app
+        if not options.verbose:
+            logging.getLogger().setLevel(logging.WARNING)
+            logging.getLogger(app.__name__).setLevel(logging.WARNING)
+            # เครื่องที่ไม่มีฟอนต์ไทยจะเตือนทุกตัวอักษรในกราฟ
+            warnings.filterwarnings("ignore", message="Glyph .* missing from font")
+
+        session = FakeSheetsSession(app.SHEET_ID, options.latency, options.jitter, options.error_rate, options.seed)
+        build_fixture(session, app, options)
+        client = gspread.Client(None, session=session, http_client=app.SheetsGateway)
+        app.connect_google_sheets = lambda max_retries=3: client
+
+        setup, run = SCENARIOS[name]
+        setup(app, options)
+        session.reset_counters()
+        app.get_app_metrics().reset()
+
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        run(app, options)
+        wall = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+        if trace_memory:
+            tracemalloc.stop()
+
+        return {
+            "scenario": name,
+            "wall_seconds": round(wall, 4),
+            "api_calls": sum(session.calls.values()),
+            "api_calls_by_operation": dict(session.calls),
+            "quota_errors": session.quota_errors,
+            "rows_written": session.rows_written,
+            "peak_memory_mb": round(peak / 2 ** 20, 2),
+        }
+
+def run_isolated(name, options, trace_memory=False):
+    """รัน scenario ในโปรเซสใหม่ ให้แคช st.cache_* และเธรดเบื้องหลังไม่ค้างจาก scenario ก่อน"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(run_scenario, name, options, trace_memory).result()
+
+def compare(results, baseline, tolerance):
+    """เทียบกับผลครั้งก่อน คืนรายการที่แย่ลง (จำนวนคำขอต้องไม่เพิ่ม เวลา/หน่วยความจำเพิ่มได้ไม่เกิน tolerance)"""
+    before = {r["scenario"]: r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        old = before.get(result["scenario"])
+        if old is None:
+            continue
+        # เธรดรีเฟรช snapshot อาจดึงชีทก่อนหรือหลังการอ่านถัดไป จำนวนคำขอจึงต่างกันได้ 1 ครั้ง
+        if result["api_calls"] > old["api_calls"] + 1:
+            regressions.append(f"{result['scenario']}: api_calls {old['api_calls']} -> {result['api_calls']}")
+        for key in ("wall_seconds", "peak_memory_mb"):
+            if old[key] and result[key] > old[key] * (1 + tolerance):
+                regressions.append(f"{result['scenario']}: {key} {old[key]} -> {result[key]}")
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="วัดประสิทธิภาพ app.py ด้วย Google Sheets จำลอง")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--sales-rows", type=int, default=1_000_000)
+    parser.add_argument("--debtors", type=int, default=500)
+    parser.add_argument("--chains", type=int, default=7, help="จำนวนสายส่ง (สูงสุดเท่ากับ DELIVERY_CHAINS)")
+    parser.add_argument("--iterations", type=int, default=20, help="จำนวนครั้งต่อ scenario ที่บันทึกการขาย")
+    parser.add_argument("--latency", type=float, default=0.0, help="วินาทีต่อคำขอ")
+    parser.add_argument("--jitter", type=float, default=0.0, help="วินาทีสุ่มเพิ่มต่อคำขอ")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="สัดส่วนคำขอที่ตอบ 429")
+    parser.add_argument("--requests-per-minute", type=int, default=1_000_000,
+                        help="โควตาของ SheetsGateway (ตั้ง 60 เพื่อจำลองโควตาจริง)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="ไม่วัดหน่วยความจำ (ข้ามรอบที่สองที่รันด้วย tracemalloc)")
+    parser.add_argument("--json", help="บันทึกผลเป็นไฟล์ JSON")
+    parser.add_argument("--compare", help="ไฟล์ JSON ผลครั้งก่อนสำหรับตรวจว่าแย่ลงหรือไม่")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    options = parse_args(argv)
+    options.chains = max(1, min(options.chains, 7))
+
+    results = []
+    print(f"{'scenario':<20}{'wall (s)':>10}{'API calls':>11}{'429':>6}{'rows':>8}{'peak MB':>10}  by operation", flush=True)
+    for name in options.scenarios:
+        result = run_isolated(name, options)
+        if options.memory:
+            # tracemalloc ทำให้ช้าลงหลายเท่า จึงวัดหน่วยความจำในรอบแยกจากรอบจับเวลา
+            result["peak_memory_mb"] = run_isolated(name, options, trace_memory=True)["peak_memory_mb"]
+        results.append(result)
+        by_operation = ", ".join(f"{op}={n}" for op, n in sorted(result["api_calls_by_operation"].items()))
+        print(f"{name:<20}{result['wall_seconds']:>10.3f}{result['api_calls']:>11}{result['quota_errors']:>6}"
+              f"{result['rows_written']:>8}{result['peak_memory_mb']:>10.1f}  {by_operation}", flush=True)
+
+    report = {
+        "config": {key: value for key, value in vars(options).items() if key not in ("json", "compare", "scenarios")},
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+    if options.json:
+        with open(options.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if options.compare:
+        with open(options.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), options.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())